@@ -0,0 +1,140 @@
+"""
+English pronunciation audio for cognates.
+Cognate words are read from the DB in keyset-paged batches of distinct
+words, so identical words across etymologies are synthesized and uploaded
+once and memory stays flat however many cognates there are.
+"""
+
+import os
+import re
+import hashlib
+import asyncio
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from app import models
+from app.database import SessionLocal, get_engine, run_db
+from app.audio.generator import AUDIO_FOLDER, AUDIO_BATCH_CONCURRENCY, store_audio
+
+COGNATE_AUDIO_FOLDER = f"{AUDIO_FOLDER}/cognates"
+
+COGNATE_LANGUAGE_CODE = os.getenv("COGNATE_TTS_LANGUAGE", "en-US")
+COGNATE_VOICE_NAME = os.getenv("COGNATE_TTS_VOICE", "en-US-Wavenet-D")
+COGNATE_VOICE_GENDER = os.getenv("COGNATE_TTS_GENDER", "MALE")
+COGNATE_SPEAKING_RATE = float(os.getenv("COGNATE_TTS_SPEAKING_RATE", "0.9"))
+
+COGNATE_PAGE_SIZE = int(os.getenv("COGNATE_AUDIO_PAGE_SIZE", "200"))
+COGNATE_AUDIO_CONCURRENCY = int(os.getenv("COGNATE_AUDIO_CONCURRENCY", str(AUDIO_BATCH_CONCURRENCY)))
+MAX_REPORTED_ERRORS = 50
+
+
+def cognate_blob_name(word: str) -> str:
+    """
+    GCS path of a cognate's pronunciation file: a readable slug plus a short
+    hash of the lowercase word, since the slug alone can collide ("zeus'" and "zeus").
+    """
+    key = word.lower()
+    slug = re.sub(r"[^a-z0-9]+", "_", key).strip("_") or "word"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:10]
+    return f"{COGNATE_AUDIO_FOLDER}/{slug}-{digest}.mp3"
+
+
+def _fetch_word_page(after: Optional[str], limit: int, only_missing: bool) -> List[Dict]:
+    """Next page of distinct words (case-insensitive) ordered by their lowercase key."""
+    get_engine()
+    with SessionLocal() as db:
+        key = func.lower(models.EnglishCognate.word)
+        query = db.query(
+            key.label("key"),
+            func.min(models.EnglishCognate.word).label("word")
+        ).filter(
+            models.EnglishCognate.word.isnot(None),
+            models.EnglishCognate.word != ""
+        )
+        if only_missing:
+            query = query.filter(models.EnglishCognate.pronunciation_audio_url.is_(None))
+        if after is not None:
+            query = query.filter(key > after)
+        rows = query.group_by(key).order_by(key).limit(limit).all()
+        return [{"key": row.key, "word": row.word} for row in rows]
+
+
+def _save_word_urls(audio_urls: Dict[str, str]):
+    """Set the audio URL on every cognate row of each word, in one commit."""
+    get_engine()
+    with SessionLocal() as db:
+        key = func.lower(models.EnglishCognate.word)
+        for word_key, audio_url in audio_urls.items():
+            db.query(models.EnglishCognate).filter(key == word_key).update(
+                {"pronunciation_audio_url": audio_url}, synchronize_session=False
+            )
+        db.commit()
+
+
+def get_cognate_audio_status() -> Dict:
+    """Distinct words with and without audio (blocking)."""
+    get_engine()
+    with SessionLocal() as db:
+        key = func.lower(models.EnglishCognate.word)
+        total = db.query(func.count(func.distinct(key))).scalar() or 0
+        missing = db.query(func.count(func.distinct(key))).filter(
+            models.EnglishCognate.pronunciation_audio_url.is_(None)
+        ).scalar() or 0
+    return {
+        "total_words": total,
+        "with_audio": total - missing,
+        "missing_audio": missing,
+        "coverage_percent": round((total - missing) / total * 100, 1) if total > 0 else 0
+    }
+
+
+async def generate_cognate_audio(
+    only_missing: bool = True,
+    page_size: int = COGNATE_PAGE_SIZE,
+    concurrency: int = COGNATE_AUDIO_CONCURRENCY
+) -> Dict:
+    """
+    Synthesize and upload English pronunciations for every distinct cognate word.
+
+    Pages of `page_size` words are processed with up to `concurrency`
+    synthesis/upload calls in flight; each page's URLs are written in one
+    commit. Words whose stored audio already matches are not re-synthesized.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    summary = {"words": 0, "synthesized": 0, "reused": 0, "failed": 0, "errors": []}
+
+    async def run_one(item: Dict) -> Optional[str]:
+        async with semaphore:
+            try:
+                result = await store_audio(
+                    item["word"],
+                    cognate_blob_name(item["word"]),
+                    speaking_rate=COGNATE_SPEAKING_RATE,
+                    language_code=COGNATE_LANGUAGE_CODE,
+                    voice_name=COGNATE_VOICE_NAME,
+                    ssml_gender=COGNATE_VOICE_GENDER
+                )
+            except Exception as e:
+                summary["failed"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append({"word": item["word"], "error": str(e)})
+                return None
+        summary["reused" if result["source"] == "gcs" else "synthesized"] += 1
+        return result["audio_url"]
+
+    after = None
+    while True:
+        page = await run_db(_fetch_word_page, after, page_size, only_missing)
+        if not page:
+            break
+        after = page[-1]["key"]
+
+        urls = await asyncio.gather(*(run_one(item) for item in page))
+        await run_db(_save_word_urls, {
+            item["key"]: url for item, url in zip(page, urls) if url
+        })
+        summary["words"] += len(page)
+        print(f"Cognate audio: {summary['words']} words processed ({summary['failed']} failed)")
+
+    return summary
@@ -1,69 +1,407 @@
 """
 Audio generation using Google Cloud Text-to-Speech API.
 Generates pronunciation audio for Greek names.
+
+Synthesis is cached by a hash of the text and voice settings: an unchanged
+name is served from the existing GCS object (its metadata records the hash)
+or from the local AUDIO_CACHE_DIR store without calling TTS.
+
+Batch mode packs many names into one SSML request with <mark> tags, asks
+for timepoints and cuts the MP3 into per-name clips at frame boundaries.
+TTS_BACKEND=fake swaps Google TTS for silent local audio with the same shape.
 """
 
-from google.cloud import texttospeech
-from google.cloud import storage
 import os
-from typing import Optional
+import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from html import escape
+from typing import Dict, List, Optional, Tuple
+
+from app import metrics
+from app.audio import mp3
+from app.storage import upload_bytes_async, delete_blob_async, get_blob_metadata, public_url
 
 BUCKET_NAME = "etymython-media"
 AUDIO_FOLDER = "audio"
 
-async def generate_pronunciation_audio(
-    greek_name: str,
-    english_name: str,
-    project_id: str = "etymython-project"
+# Voice settings (part of the synthesis cache key)
+TTS_LANGUAGE_CODE = "el-GR"  # Greek
+TTS_VOICE_NAME = "el-GR-Wavenet-A"  # High-quality Wavenet voice
+TTS_SPEAKING_RATE = 0.85  # Slightly slower for learning
+TTS_PITCH = 0.0
+TTS_AUDIO_ENCODING = "MP3"
+
+# "google" or "fake" (silent audio, no credentials; for tests and local runs)
+TTS_BACKEND = os.getenv("TTS_BACKEND", "google")
+
+# Figures synthesized at once by batch generation
+AUDIO_BATCH_CONCURRENCY = int(os.getenv("AUDIO_BATCH_CONCURRENCY", "8"))
+
+# SSML batch mode: names per TTS request and the pause separating them
+AUDIO_SSML_BATCH = os.getenv("AUDIO_SSML_BATCH", "0") == "1"
+AUDIO_SSML_BATCH_SIZE = int(os.getenv("AUDIO_SSML_BATCH_SIZE", "40"))
+AUDIO_SSML_BREAK_MS = int(os.getenv("AUDIO_SSML_BREAK_MS", "500"))
+
+# Local synthesis store; set AUDIO_CACHE_DIR="" to disable
+AUDIO_CACHE_DIR = os.getenv(
+    "AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "etymython-audio-cache")
+)
+
+
+_tts_client = None
+_tts_beta_client = None
+_tts_client_lock = threading.Lock()
+
+
+def get_tts_client():
+    """Shared TextToSpeechClient (thread-safe; created on first use)."""
+    global _tts_client
+    if _tts_client is None:
+        with _tts_client_lock:
+            if _tts_client is None:
+                # Imported here so the SDK is only loaded when first needed
+                from google.cloud import texttospeech
+                _tts_client = texttospeech.TextToSpeechClient()
+    return _tts_client
+
+
+def get_tts_beta_client():
+    """Shared v1beta1 client; only v1beta1 returns SSML mark timepoints."""
+    global _tts_beta_client
+    if _tts_beta_client is None:
+        with _tts_client_lock:
+            if _tts_beta_client is None:
+                from google.cloud import texttospeech_v1beta1
+                _tts_beta_client = texttospeech_v1beta1.TextToSpeechClient()
+    return _tts_beta_client
+
+
+def synthesis_cache_key(
+    text: str,
+    language_code: str = TTS_LANGUAGE_CODE,
+    voice_name: str = TTS_VOICE_NAME,
+    speaking_rate: float = TTS_SPEAKING_RATE,
+    pitch: float = TTS_PITCH,
+    audio_encoding: str = TTS_AUDIO_ENCODING,
+    mode: str = "single"
 ) -> str:
     """
-    Generate pronunciation audio for a Greek name using Google Cloud TTS.
-    
-    Args:
-        greek_name: The Greek name to pronounce (e.g., "Ἀφροδίτη")
-        english_name: English name for filename (e.g., "Aphrodite")
-        project_id: GCP project ID
-        
-    Returns:
-        Public URL of the uploaded audio file
+    SHA-256 of everything that affects the synthesized audio. `mode` is
+    "single" (the text on its own) or "ssml_batch" (a clip cut from a
+    multi-name request, with its neighbours' prosody and frame-aligned edges).
     """
-    # Initialize clients
-    tts_client = texttospeech.TextToSpeechClient()
-    storage_client = storage.Client(project=project_id)
+    inputs = {
+        "text": unicodedata.normalize("NFC", text.strip()),
+        "language_code": language_code,
+        "voice_name": voice_name,
+        "speaking_rate": speaking_rate,
+        "pitch": pitch,
+        "audio_encoding": audio_encoding
+    }
+    if mode != "single":
+        inputs["mode"] = mode
+    if TTS_BACKEND != "google":
+        # Keep fake audio from ever matching real cache entries
+        inputs["backend"] = TTS_BACKEND
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Optional[str]:
+    return os.path.join(AUDIO_CACHE_DIR, f"{key}.mp3") if AUDIO_CACHE_DIR else None
+
+
+def _read_cached_audio(key: str) -> Optional[bytes]:
+    path = _cache_path(key)
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_cached_audio(key: str, audio: bytes):
+    path = _cache_path(key)
+    if not path:
+        return
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    # Write then rename so a concurrent reader never sees a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(audio)
+    os.replace(tmp_path, path)
+
+
+def synthesize_speech(
+    text: str,
+    speaking_rate: float = TTS_SPEAKING_RATE,
+    language_code: str = TTS_LANGUAGE_CODE,
+    voice_name: str = TTS_VOICE_NAME,
+    ssml_gender: str = "FEMALE"
+) -> Tuple[bytes, bool]:
+    """
+    Synthesize `text` (Greek voice by default), using the local store when possible.
+    Returns (mp3 bytes, served_from_cache). Blocking; async callers use a thread.
+    """
+    key = synthesis_cache_key(
+        text, language_code=language_code, voice_name=voice_name, speaking_rate=speaking_rate
+    )
+    cached = _read_cached_audio(key)
+    if cached is not None:
+        return cached, True
+
+    if TTS_BACKEND == "fake":
+        audio = mp3.silent_frames(_fake_duration(text, speaking_rate))
+        _write_cached_audio(key, audio)
+        return audio, False
+
+    from google.cloud import texttospeech
+
+    tts_client = get_tts_client()
     
     # Configure TTS
-    synthesis_input = texttospeech.SynthesisInput(text=greek_name)
+    synthesis_input = texttospeech.SynthesisInput(text=text)
     
-    # Use Greek voice for authentic pronunciation
     voice = texttospeech.VoiceSelectionParams(
-        language_code="el-GR",  # Greek
-        name="el-GR-Wavenet-A",  # High-quality Wavenet voice
-        ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
+        language_code=language_code,
+        name=voice_name,
+        ssml_gender=getattr(texttospeech.SsmlVoiceGender, ssml_gender)
     )
     
     audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3,
-        speaking_rate=0.85,  # Slightly slower for learning
-        pitch=0.0
+        audio_encoding=getattr(texttospeech.AudioEncoding, TTS_AUDIO_ENCODING),
+        speaking_rate=speaking_rate,
+        pitch=TTS_PITCH
     )
     
     # Generate audio
-    response = tts_client.synthesize_speech(
-        input=synthesis_input,
-        voice=voice,
-        audio_config=audio_config
-    )
+    with metrics.track("google_tts", "synthesize", voice_name) as usage:
+        response = tts_client.synthesize_speech(
+            input=synthesis_input,
+            voice=voice,
+            audio_config=audio_config
+        )
+        usage["characters"] = len(text)
     
-    # Upload to GCS
+    _write_cached_audio(key, response.audio_content)
+    return response.audio_content, False
+
+
+def build_marked_ssml(texts: List[str]) -> str:
+    """SSML with start/end marks around each text and a pause between them."""
+    parts = ["<speak>"]
+    for i, text in enumerate(texts):
+        parts.append(
+            f'<mark name="s{i}"/>{escape(text)}<mark name="e{i}"/>'
+            f'<break time="{AUDIO_SSML_BREAK_MS}ms"/>'
+        )
+    parts.append("</speak>")
+    return "".join(parts)
+
+
+def _fake_duration(text: str, speaking_rate: float) -> float:
+    return 0.08 * max(len(text), 1) / speaking_rate
+
+
+def _synthesize_marked_fake(texts: List[str], speaking_rate: float) -> Tuple[bytes, Dict[str, float]]:
+    """Silent audio laid out like a marked SSML response."""
+    chunks, timepoints, elapsed = [], {}, 0.0
+    for i, text in enumerate(texts):
+        for mark, duration in ((f"s{i}", _fake_duration(text, speaking_rate)),
+                               (f"e{i}", AUDIO_SSML_BREAK_MS / 1000)):
+            timepoints[mark] = elapsed
+            frames = mp3.silent_frames(duration)
+            chunks.append(frames)
+            elapsed += mp3.duration(frames)
+    return b"".join(chunks), timepoints
+
+
+def _synthesize_marked_google(texts: List[str], speaking_rate: float) -> Tuple[bytes, Dict[str, float]]:
+    from google.cloud import texttospeech_v1beta1 as tts
+
+    request = tts.SynthesizeSpeechRequest(
+        input=tts.SynthesisInput(ssml=build_marked_ssml(texts)),
+        voice=tts.VoiceSelectionParams(
+            language_code=TTS_LANGUAGE_CODE,
+            name=TTS_VOICE_NAME,
+            ssml_gender=tts.SsmlVoiceGender.FEMALE
+        ),
+        audio_config=tts.AudioConfig(
+            audio_encoding=getattr(tts.AudioEncoding, TTS_AUDIO_ENCODING),
+            speaking_rate=speaking_rate,
+            pitch=TTS_PITCH
+        ),
+        enable_time_pointing=[tts.SynthesizeSpeechRequest.TimepointType.SSML_MARK]
+    )
+    with metrics.track("google_tts", "synthesize.ssml_marks", TTS_VOICE_NAME) as usage:
+        response = get_tts_beta_client().synthesize_speech(request=request)
+        # SSML is billed on characters sent, markup included
+        usage["characters"] = len(request.input.ssml)
+    return response.audio_content, {tp.mark_name: tp.time_seconds for tp in response.timepoints}
+
+
+def synthesize_batch(
+    texts: List[str],
+    speaking_rate: float = TTS_SPEAKING_RATE
+) -> List[Tuple[bytes, bool, str]]:
+    """
+    Synthesize many texts with one TTS request per AUDIO_SSML_BATCH_SIZE names.
+    Texts in the local store (either mode) are not sent; a text whose marks
+    are missing from the response is synthesized on its own. Returns
+    (mp3 bytes, served_from_cache, synthesis_cache_key) per text, in order.
+    Blocking; async callers use a thread.
+    """
+    results: List[Optional[Tuple[bytes, bool, str]]] = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        for mode in ("single", "ssml_batch"):
+            key = synthesis_cache_key(text, speaking_rate=speaking_rate, mode=mode)
+            cached = _read_cached_audio(key)
+            if cached is not None:
+                results[i] = (cached, True, key)
+                break
+        else:
+            missing.append(i)
+
+    synthesize_marked = _synthesize_marked_fake if TTS_BACKEND == "fake" else _synthesize_marked_google
+    for start in range(0, len(missing), max(1, AUDIO_SSML_BATCH_SIZE)):
+        indexes = missing[start:start + AUDIO_SSML_BATCH_SIZE]
+        audio, timepoints = synthesize_marked([texts[i] for i in indexes], speaking_rate)
+        frames = mp3.parse_frames(audio)
+        for n, i in enumerate(indexes):
+            if f"s{n}" not in timepoints or f"e{n}" not in timepoints:
+                print(f"TTS response is missing timepoints for {texts[i]!r}; synthesizing it alone")
+                audio_alone, from_disk = synthesize_speech(texts[i], speaking_rate)
+                results[i] = (audio_alone, from_disk, synthesis_cache_key(texts[i], speaking_rate=speaking_rate))
+                continue
+            key = synthesis_cache_key(texts[i], speaking_rate=speaking_rate, mode="ssml_batch")
+            clip = mp3.slice_frames(audio, timepoints[f"s{n}"], timepoints[f"e{n}"], frames)
+            _write_cached_audio(key, clip)
+            results[i] = (clip, False, key)
+    return results
+
+
+def audio_blob_name(english_name: str) -> str:
+    """GCS path of a figure's pronunciation file."""
     filename = f"{english_name.lower().replace(' ', '_')}.mp3"
-    blob_name = f"{AUDIO_FOLDER}/{filename}"
+    return f"{AUDIO_FOLDER}/{filename}"
+
+
+async def store_audio(
+    text: str,
+    blob_name: str,
+    speaking_rate: float = TTS_SPEAKING_RATE,
+    language_code: str = TTS_LANGUAGE_CODE,
+    voice_name: str = TTS_VOICE_NAME,
+    ssml_gender: str = "FEMALE"
+) -> dict:
+    """
+    Make sure the spoken `text` is in GCS at `blob_name`.
+
+    Returns {"audio_url", "source"} where source is "gcs" (object already
+    matches, nothing done), "disk" (local store, uploaded) or "tts" (synthesized).
+    """
+    key = synthesis_cache_key(
+        text, language_code=language_code, voice_name=voice_name, speaking_rate=speaking_rate
+    )
     
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(blob_name)
-    blob.upload_from_string(response.audio_content, content_type="audio/mpeg")
-    blob.make_public()
+    metadata = await asyncio.to_thread(get_blob_metadata, blob_name, BUCKET_NAME)
+    if metadata and metadata.get("synthesis_hash") == key:
+        return {"audio_url": public_url(blob_name, BUCKET_NAME), "source": "gcs"}
+    
+    audio, from_disk = await asyncio.to_thread(
+        synthesize_speech, text, speaking_rate, language_code, voice_name, ssml_gender
+    )
     
-    return blob.public_url
+    # Upload to GCS; the hash lets the next run skip synthesis and upload
+    blob = await upload_bytes_async(
+        blob_name,
+        audio,
+        "audio/mpeg",
+        bucket_name=BUCKET_NAME,
+        metadata={"synthesis_hash": key, "synthesis_mode": "single", "voice": voice_name}
+    )
+    return {"audio_url": blob.public_url, "source": "disk" if from_disk else "tts"}
+
+
+async def store_pronunciation_audio(
+    greek_name: str,
+    english_name: str,
+    speaking_rate: float = TTS_SPEAKING_RATE
+) -> dict:
+    """Make sure the pronunciation for `greek_name` is in GCS (see store_audio)."""
+    return await store_audio(greek_name, audio_blob_name(english_name), speaking_rate)
+
+
+async def store_pronunciation_batch(
+    names: List[Tuple[str, str]],
+    speaking_rate: float = TTS_SPEAKING_RATE
+) -> List[dict]:
+    """
+    store_pronunciation_audio for many (greek_name, english_name) pairs.
+    Names whose GCS object is out of date are synthesized together through
+    SSML marks; an object from either synthesis mode counts as current.
+    Returns {"audio_url", "source"} per pair, in order.
+    """
+    blob_names = [audio_blob_name(english) for _, english in names]
+    keys = [
+        {synthesis_cache_key(greek, speaking_rate=speaking_rate, mode=mode) for mode in ("single", "ssml_batch")}
+        for greek, _ in names
+    ]
+    
+    metadata = await asyncio.gather(*(
+        asyncio.to_thread(get_blob_metadata, blob_name, BUCKET_NAME) for blob_name in blob_names
+    ))
+    results: List[Optional[dict]] = [None] * len(names)
+    stale = []
+    for i, meta in enumerate(metadata):
+        if meta and meta.get("synthesis_hash") in keys[i]:
+            results[i] = {"audio_url": public_url(blob_names[i], BUCKET_NAME), "source": "gcs"}
+        else:
+            stale.append(i)
+    
+    if stale:
+        clips = await asyncio.to_thread(synthesize_batch, [names[i][0] for i in stale], speaking_rate)
+        
+        async def upload(i: int, clip: Tuple[bytes, bool, str]):
+            audio, from_disk, key = clip
+            mode = "single" if key == synthesis_cache_key(names[i][0], speaking_rate=speaking_rate) else "ssml_batch"
+            blob = await upload_bytes_async(
+                blob_names[i],
+                audio,
+                "audio/mpeg",
+                bucket_name=BUCKET_NAME,
+                metadata={"synthesis_hash": key, "synthesis_mode": mode, "voice": TTS_VOICE_NAME}
+            )
+            results[i] = {"audio_url": blob.public_url, "source": "disk" if from_disk else "tts"}
+        
+        await asyncio.gather(*(upload(i, clip) for i, clip in zip(stale, clips)))
+    
+    return results
+
+
+async def generate_pronunciation_audio(
+    greek_name: str,
+    english_name: str,
+    project_id: str = "etymython-project"
+) -> str:
+    """
+    Generate pronunciation audio for a Greek name using Google Cloud TTS.
+    Skips synthesis and upload when the stored file already matches.
+    
+    Args:
+        greek_name: The Greek name to pronounce (e.g., "Ἀφροδίτη")
+        english_name: English name for filename (e.g., "Aphrodite")
+        project_id: GCP project ID
+        
+    Returns:
+        Public URL of the uploaded audio file
+    """
+    result = await store_pronunciation_audio(greek_name, english_name)
+    return result["audio_url"]
 
 
 async def delete_pronunciation_audio(audio_url: str, project_id: str = "etymython-project"):
@@ -78,10 +416,4 @@ async def delete_pronunciation_audio(audio_url: str, project_id: str = "etymytho
     # Format: https://storage.googleapis.com/etymython-media/audio/filename.mp3
     if "etymython-media" in audio_url:
         blob_name = audio_url.split("etymython-media/")[1]
-        
-        storage_client = storage.Client(project=project_id)
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blob = bucket.blob(blob_name)
-        
-        if blob.exists():
-            blob.delete()
+        await delete_blob_async(blob_name, bucket_name=BUCKET_NAME)
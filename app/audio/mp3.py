@@ -0,0 +1,115 @@
+"""
+Minimal MPEG audio (Layer III) frame parsing.
+Used to cut one synthesized MP3 into per-name clips at frame boundaries
+without decoding, and to build silent frames for the fake TTS backend.
+"""
+from typing import List, NamedTuple, Optional
+
+# Bitrates in kbps for Layer III, by MPEG version (1 vs 2/2.5)
+_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+
+class Frame(NamedTuple):
+    offset: int
+    length: int
+    start: float  # seconds
+    duration: float
+
+
+def _parse_header(header: bytes) -> Optional[tuple]:
+    """Return (frame_length, samples, sample_rate) for a Layer III header, else None."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    bitrate = _BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    samples = 1152 if mpeg1 else 576
+    frame_length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+    return frame_length, samples, sample_rate
+
+
+def _skip_id3(data: bytes) -> int:
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size
+
+
+def parse_frames(data: bytes) -> List[Frame]:
+    """List the audio frames in `data`, skipping ID3 tags, Xing/Info headers and junk."""
+    frames = []
+    offset = _skip_id3(data)
+    elapsed = 0.0
+    while offset + 4 <= len(data):
+        parsed = _parse_header(data[offset:offset + 4])
+        if parsed is None or offset + parsed[0] > len(data):
+            offset += 1  # resync on the next sync word
+            continue
+        frame_length, samples, sample_rate = parsed
+        body = data[offset:offset + frame_length]
+        if not frames and (b"Xing" in body or b"Info" in body):
+            # VBR header frame carries the whole file's frame count; drop it
+            offset += frame_length
+            continue
+        duration = samples / sample_rate
+        frames.append(Frame(offset, frame_length, elapsed, duration))
+        elapsed += duration
+        offset += frame_length
+    return frames
+
+
+def duration(data: bytes) -> float:
+    """Playing time of `data` in seconds."""
+    return sum(frame.duration for frame in parse_frames(data))
+
+
+def slice_frames(
+    data: bytes,
+    start: float,
+    end: Optional[float] = None,
+    frames: Optional[List[Frame]] = None,
+    pad_frames: int = 1
+) -> bytes:
+    """
+    Bytes of the frames overlapping [start, end) seconds.
+
+    `pad_frames` extra frames are kept on each side: Layer III frames may
+    borrow bits from earlier frames, and the padding lands in the silence
+    between names rather than clipping a syllable.
+    """
+    frames = frames if frames is not None else parse_frames(data)
+    selected = [
+        i for i, frame in enumerate(frames)
+        if frame.start + frame.duration > start and (end is None or frame.start < end)
+    ]
+    if not selected:
+        return b""
+    first = max(0, selected[0] - pad_frames)
+    last = min(len(frames) - 1, selected[-1] + pad_frames)
+    return data[frames[first].offset:frames[last].offset + frames[last].length]
+
+
+def silent_frames(duration: float) -> bytes:
+    """Silent MPEG-2 Layer III audio (24 kHz mono, 32 kbps) lasting about `duration` seconds."""
+    # sync + MPEG 2 + Layer III + no CRC | 32 kbps, 24 kHz | mono
+    frame = bytes([0xFF, 0xF3, 0x44, 0xC0]) + bytes(92)  # 72 * 32000 / 24000 = 96 bytes
+    count = max(1, round(duration * 24000 / 576))
+    return frame * count
@@ -2,15 +2,27 @@
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional
 from pydantic import BaseModel
+import asyncio
+import os
 
-from app.database import get_db
-from app import models
-from app.audio.generator import generate_pronunciation_audio
+from app.database import get_db, run_db
+from app import models, crud, jobs, status
+from app.audio.cognates import generate_cognate_audio, get_cognate_audio_status
+from app.audio.generator import (
+    generate_pronunciation_audio,
+    store_pronunciation_batch,
+    AUDIO_BATCH_CONCURRENCY,
+    AUDIO_SSML_BATCH,
+    AUDIO_SSML_BATCH_SIZE
+)
 
 router = APIRouter(prefix="/api/v1/audio", tags=["audio"])
 
+# Figures whose URL updates and checkpoints are committed together
+AUDIO_COMMIT_BATCH_SIZE = int(os.getenv("AUDIO_COMMIT_BATCH_SIZE", "25"))
+
 
 class AudioGenerationResponse(BaseModel):
     figure_id: int
@@ -20,12 +32,52 @@ class AudioGenerationResponse(BaseModel):
 
 
 class BatchAudioResponse(BaseModel):
+    job_id: Optional[int] = None
+    resumed: bool = False
     total: int
     successful: int
     failed: int
     details: List[dict]
 
 
+def _save_audio_url(db: Session, figure_id: int, audio_url: str):
+    figure = db.get(models.MythologicalFigure, figure_id)
+    figure.pronunciation_audio_url = audio_url
+    db.commit()
+
+
+def _save_audio_urls(db: Session, audio_urls: Dict[int, str], job_id: int, checkpoints: Dict[str, dict]):
+    """Update several figures' audio URLs and their job checkpoints in one commit."""
+    if audio_urls:
+        figures = db.query(models.MythologicalFigure).filter(
+            models.MythologicalFigure.id.in_(list(audio_urls))
+        ).all()
+        for figure in figures:
+            figure.pronunciation_audio_url = audio_urls[figure.id]
+    jobs.stage_items_succeeded(db, job_id, checkpoints)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _list_figures_with_greek_names(db: Session) -> List[dict]:
+    figures = db.query(models.MythologicalFigure).filter(
+        models.MythologicalFigure.greek_name.isnot(None),
+        models.MythologicalFigure.greek_name != ""
+    ).all()
+    return [
+        {
+            "id": f.id,
+            "greek_name": f.greek_name,
+            "english_name": f.english_name,
+            "audio_url": f.pronunciation_audio_url
+        }
+        for f in figures
+    ]
+
+
 @router.post("/generate/{figure_id}", response_model=AudioGenerationResponse)
 async def generate_audio_for_figure(
     figure_id: int,
@@ -35,9 +87,7 @@ async def generate_audio_for_figure(
     Generate pronunciation audio for a specific figure.
     """
     # Get figure
-    figure = db.query(models.MythologicalFigure).filter(
-        models.MythologicalFigure.id == figure_id
-    ).first()
+    figure = await run_db(crud.get_figure, db, figure_id)
     
     if not figure:
         raise HTTPException(status_code=404, detail="Figure not found")
@@ -48,20 +98,21 @@ async def generate_audio_for_figure(
             detail=f"Figure {figure.english_name} has no Greek name"
         )
     
+    figure_name = figure.english_name
+    
     try:
         # Generate audio
         audio_url = await generate_pronunciation_audio(
             greek_name=figure.greek_name,
-            english_name=figure.english_name
+            english_name=figure_name
         )
         
         # Update database
-        figure.pronunciation_audio_url = audio_url
-        db.commit()
+        await run_db(_save_audio_url, db, figure_id, audio_url)
         
         return AudioGenerationResponse(
-            figure_id=figure.id,
-            figure_name=figure.english_name,
+            figure_id=figure_id,
+            figure_name=figure_name,
             audio_url=audio_url,
             message="Audio generated successfully"
         )
@@ -76,70 +127,180 @@ async def generate_audio_for_figure(
 @router.post("/generate-all", response_model=BatchAudioResponse)
 async def generate_audio_for_all_figures(
     background_tasks: BackgroundTasks,
+    ssml_batch: bool = AUDIO_SSML_BATCH,
     db: Session = Depends(get_db)
 ):
     """
     Generate pronunciation audio for all figures with Greek names.
-    Runs as background task to avoid timeout.
+    With ssml_batch, names are synthesized AUDIO_SSML_BATCH_SIZE per TTS request
+    and split into clips locally; otherwise one request per figure.
+    Requests run up to AUDIO_BATCH_CONCURRENCY at a time and URL
+    updates are committed in batches of AUDIO_COMMIT_BATCH_SIZE, in the same
+    transaction as their job checkpoints; an interrupted run resumes with the
+    figures whose batch was not committed.
     """
     # Get all figures with Greek names
-    figures = db.query(models.MythologicalFigure).filter(
-        models.MythologicalFigure.greek_name.isnot(None),
-        models.MythologicalFigure.greek_name != ""
-    ).all()
+    figures = await run_db(_list_figures_with_greek_names, db)
     
-    results = {
-        "total": len(figures),
-        "successful": 0,
-        "failed": 0,
-        "details": []
-    }
+    try:
+        job = await run_db(jobs.start_or_resume_job, "audio", [str(f["id"]) for f in figures])
+    except jobs.JobInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    job_id = job["job_id"]
+    pending = set(job["pending"])
+    figures = [f for f in figures if str(f["id"]) in pending]
+    
+    semaphore = asyncio.Semaphore(max(1, AUDIO_BATCH_CONCURRENCY))
+    commit_lock = asyncio.Lock()
+    buffer = {"urls": {}, "results": {}}
+    flush_errors: Dict[str, str] = {}  # figure key -> error for batches that failed to commit
     
-    for figure in figures:
+    async def flush():
+        # Swap the buffer out before awaiting so other tasks keep appending
+        urls, checkpoints = buffer["urls"], buffer["results"]
+        buffer["urls"], buffer["results"] = {}, {}
+        if not (urls or checkpoints):
+            return
         try:
-            # Generate audio
-            audio_url = await generate_pronunciation_audio(
-                greek_name=figure.greek_name,
-                english_name=figure.english_name
-            )
-            
-            # Update database
-            figure.pronunciation_audio_url = audio_url
-            db.commit()
-            
-            results["successful"] += 1
-            results["details"].append({
-                "figure_id": figure.id,
-                "figure_name": figure.english_name,
-                "status": "success",
-                "audio_url": audio_url
-            })
-            
+            await run_db(_save_audio_urls, db, urls, job_id, checkpoints)
         except Exception as e:
-            results["failed"] += 1
-            results["details"].append({
-                "figure_id": figure.id,
-                "figure_name": figure.english_name,
-                "status": "failed",
-                "error": str(e)
-            })
+            # _save_audio_urls rolled back: no URL or checkpoint in this batch is saved,
+            # so fail its figures and a resume retries them
+            error = f"Saving results failed: {e}"
+            for key in checkpoints:
+                flush_errors[key] = error
+                await run_db(jobs.mark_item_failed, job_id, key, error)
     
-    return BatchAudioResponse(**results)
+    async def record_success(figure: dict, audio_url: str) -> dict:
+        async with commit_lock:
+            # Unchanged audio keeps its URL and needs no update
+            if audio_url != figure["audio_url"]:
+                buffer["urls"][figure["id"]] = audio_url
+            buffer["results"][str(figure["id"])] = {"audio_url": audio_url}
+            if len(buffer["results"]) >= AUDIO_COMMIT_BATCH_SIZE:
+                await flush()
+        return {
+            "figure_id": figure["id"],
+            "figure_name": figure["english_name"],
+            "status": "success",
+            "audio_url": audio_url
+        }
+    
+    async def record_failure(figure: dict, error: Exception) -> dict:
+        await run_db(jobs.mark_item_failed, job_id, str(figure["id"]), str(error))
+        return {
+            "figure_id": figure["id"],
+            "figure_name": figure["english_name"],
+            "status": "failed",
+            "error": str(error)
+        }
+    
+    async def run_one(figure: dict) -> dict:
+        async with semaphore:
+            await run_db(jobs.mark_item_running, job_id, str(figure["id"]))
+            try:
+                audio_url = await generate_pronunciation_audio(
+                    greek_name=figure["greek_name"],
+                    english_name=figure["english_name"]
+                )
+            except Exception as e:
+                return await record_failure(figure, e)
+        return await record_success(figure, audio_url)
+    
+    async def run_chunk(chunk: List[dict]) -> List[dict]:
+        # One SSML request covers the whole chunk
+        async with semaphore:
+            for figure in chunk:
+                await run_db(jobs.mark_item_running, job_id, str(figure["id"]))
+            try:
+                stored = await store_pronunciation_batch(
+                    [(f["greek_name"], f["english_name"]) for f in chunk]
+                )
+            except Exception as e:
+                return [await record_failure(figure, e) for figure in chunk]
+        return [await record_success(f, r["audio_url"]) for f, r in zip(chunk, stored)]
+    
+    if ssml_batch:
+        chunks = [
+            figures[i:i + AUDIO_SSML_BATCH_SIZE]
+            for i in range(0, len(figures), max(1, AUDIO_SSML_BATCH_SIZE))
+        ]
+        details = [d for chunk in await asyncio.gather(*(run_chunk(c) for c in chunks)) for d in chunk]
+    else:
+        details = await asyncio.gather(*(run_one(f) for f in figures))
+    async with commit_lock:
+        await flush()
+    for detail in details:
+        error = flush_errors.get(str(detail["figure_id"]))
+        if error:
+            detail["status"] = "failed"
+            detail["error"] = error
+            detail.pop("audio_url", None)
+    await run_db(jobs.finish_job, job_id)
+    
+    successful = sum(1 for d in details if d["status"] == "success")
+    return BatchAudioResponse(
+        job_id=job_id,
+        resumed=job["resumed"],
+        total=len(figures),
+        successful=successful,
+        failed=len(details) - successful,
+        details=list(details)
+    )
+
+
+@router.get("/generate-status")
+def get_audio_generation_status():
+    """Progress of the latest audio batch (shared across workers)."""
+    return jobs.get_job_status("audio") or {"status": None, "total": 0}
+
+
+async def _run_cognate_audio(only_missing: bool):
+    """Background task for the cognate audio pipeline."""
+    try:
+        summary = await generate_cognate_audio(only_missing=only_missing)
+        print(f"Cognate audio complete: {summary}")
+    except Exception as e:
+        print(f"Cognate audio error: {e}")
+
+
+@router.post("/cognates/generate-all")
+async def generate_audio_for_all_cognates(
+    background_tasks: BackgroundTasks,
+    only_missing: bool = True
+):
+    """
+    Generate English pronunciation audio for every distinct cognate word.
+    Runs in the background; words are paged from the DB, so this scales to
+    thousands of cognates. Re-running picks up words still missing audio.
+    """
+    background_tasks.add_task(_run_cognate_audio, only_missing)
+    status = await run_db(get_cognate_audio_status)
+    return {
+        "message": f"Started cognate audio generation for {status['missing_audio'] if only_missing else status['total_words']} words",
+        "status_endpoint": "/api/v1/audio/cognates/status",
+        **status
+    }
+
+
+@router.get("/cognates/status")
+def get_cognate_audio_generation_status():
+    """Distinct cognate words with and without pronunciation audio."""
+    return get_cognate_audio_status()
 
 
 @router.get("/status")
-async def get_audio_status(db: Session = Depends(get_db)):
+def get_audio_status(db: Session = Depends(get_db)):
     """
     Get audio generation status - how many figures have audio.
     """
-    total = db.query(models.MythologicalFigure).count()
-    with_audio = db.query(models.MythologicalFigure).filter(
-        models.MythologicalFigure.pronunciation_audio_url.isnot(None)
-    ).count()
+    figures = status.get_figure_status(db)
+    total = figures["total_figures"]
+    with_audio = figures["with_audio"]
     
     return {
         "total_figures": total,
         "with_audio": with_audio,
         "without_audio": total - with_audio,
-        "percentage": round((with_audio / total * 100) if total > 0 else 0, 1)
+        "percentage": status.percentage(with_audio, total)
     }
@@ -1,17 +1,116 @@
 import os
-from google.cloud import secretmanager
+import threading
+import time
+from typing import Dict
+
+# Secret cache configuration
+SECRET_CACHE_TTL = float(os.getenv("SECRET_CACHE_TTL", "3600"))  # seconds a fetched secret stays valid
+SECRET_REFRESH_AHEAD = float(os.getenv("SECRET_REFRESH_AHEAD", "300"))  # refresh this long before expiry
+SECRET_FALLBACK_TTL = float(os.getenv("SECRET_FALLBACK_TTL", "60"))  # cache env fallbacks briefly
+
+_secret_client = None
+_secret_client_lock = threading.Lock()
+
+# Process-wide secret cache: "project/secret" -> {"value", "expires_at", "refreshing"}
+_secret_cache: Dict[str, dict] = {}
+_secret_locks: Dict[str, threading.Lock] = {}
+_secret_locks_guard = threading.Lock()
+
+
+def _get_secret_client():
+    """Return the shared Secret Manager client, creating it on first use."""
+    global _secret_client
+    if _secret_client is None:
+        with _secret_client_lock:
+            if _secret_client is None:
+                from google.cloud import secretmanager
+                _secret_client = secretmanager.SecretManagerServiceClient()
+    return _secret_client
+
+
+def _get_secret_lock(key: str) -> threading.Lock:
+    with _secret_locks_guard:
+        if key not in _secret_locks:
+            _secret_locks[key] = threading.Lock()
+        return _secret_locks[key]
+
+
+def _fetch_secret(secret_id: str, project_id: str) -> str:
+    """Fetch a secret from Secret Manager."""
+    client = _get_secret_client()
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+    response = client.access_secret_version(request={"name": name})
+    return response.payload.data.decode("UTF-8").strip()
+
+
+def _store_secret(key: str, value: str, ttl: float):
+    _secret_cache[key] = {
+        "value": value,
+        "expires_at": time.monotonic() + ttl,
+        "refreshing": False,
+    }
+
+
+def _refresh_secret(key: str, secret_id: str, project_id: str):
+    """Background refresh; keeps serving the old value if the fetch fails."""
+    lock = _get_secret_lock(key)
+    with lock:
+        try:
+            _store_secret(key, _fetch_secret(secret_id, project_id), SECRET_CACHE_TTL)
+        except Exception as e:
+            print(f"Secret refresh failed for {secret_id}: {e}")
+        finally:
+            if key in _secret_cache:
+                _secret_cache[key]["refreshing"] = False
+
 
 def get_secret(secret_id: str, project_id: str = "etymython-project") -> str:
-    """Retrieve secret from Google Secret Manager."""
-    try:
-        client = secretmanager.SecretManagerServiceClient()
-        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-        response = client.access_secret_version(request={"name": name})
-        return response.payload.data.decode("UTF-8").strip()
-    except Exception as e:
-        # Fall back to environment variable for local development
-        env_key = secret_id.upper().replace("-", "_")
-        return os.getenv(env_key, "")
+    """
+    Retrieve secret from Google Secret Manager.
+
+    Values are cached per process for SECRET_CACHE_TTL seconds and refreshed
+    in the background shortly before they expire. Concurrent callers for the
+    same secret share a single in-flight fetch.
+    """
+    key = f"{project_id}/{secret_id}"
+    now = time.monotonic()
+
+    entry = _secret_cache.get(key)
+    if entry and now < entry["expires_at"]:
+        if now >= entry["expires_at"] - SECRET_REFRESH_AHEAD and not entry["refreshing"]:
+            entry["refreshing"] = True
+            threading.Thread(
+                target=_refresh_secret,
+                args=(key, secret_id, project_id),
+                daemon=True,
+            ).start()
+        return entry["value"]
+
+    lock = _get_secret_lock(key)
+    with lock:
+        # Another caller may have fetched it while we waited
+        entry = _secret_cache.get(key)
+        if entry and time.monotonic() < entry["expires_at"]:
+            return entry["value"]
+
+        try:
+            value = _fetch_secret(secret_id, project_id)
+            _store_secret(key, value, SECRET_CACHE_TTL)
+        except Exception as e:
+            # Fall back to environment variable for local development
+            env_key = secret_id.upper().replace("-", "_")
+            value = os.getenv(env_key, "")
+            _store_secret(key, value, SECRET_FALLBACK_TTL)
+        return value
+
+
+def get_openai_api_key() -> str:
+    """Get the OpenAI API key from the environment or the cached Secret Manager value."""
+    api_key = os.getenv("OPENAI_API_KEY") or get_secret("openai-api-key")
+    if not api_key:
+        raise ValueError("OpenAI API key is empty")
+    return api_key
+
 
 # Database configuration
 SQL_SERVER = os.getenv("SQL_SERVER", "35.224.242.223")
@@ -0,0 +1,362 @@
+"""
+Offline bulk content generation through the OpenAI Batch API.
+Every missing origin story and fun fact list is written to one JSONL batch,
+submitted at the Batch API's lower price, polled until it completes, and
+ingested into origin_story / fun_facts in bulk transactions.
+
+The submitted batch id is kept in the job store (kind "content_batch"), so
+a restarted worker resumes polling the same batch instead of resubmitting.
+CONTENT_BATCH_BACKEND=local swaps the Batch API for a file-based fake that
+completes immediately with placeholder content, for offline testing.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from app import crud, jobs, metrics
+from app.content import cache
+from app.content.generator import (
+    get_openai_client,
+    _origin_story_request,
+    _fun_facts_request,
+    _figure_content_request,
+    parse_fun_facts,
+    parse_figure_content,
+    parse_origin_story
+)
+from app.database import SessionLocal, get_engine, run_db
+
+JOB_KIND = "content_batch"
+
+CONTENT_BATCH_BACKEND = os.getenv("CONTENT_BATCH_BACKEND", "openai")  # openai | local
+CONTENT_BATCH_DIR = os.getenv(
+    "CONTENT_BATCH_DIR", os.path.join(tempfile.gettempdir(), "etymython-batches")
+)
+CONTENT_BATCH_POLL_SECONDS = float(os.getenv("CONTENT_BATCH_POLL_SECONDS", "30"))
+# Figures written per ingest transaction
+CONTENT_BATCH_INGEST_SIZE = int(os.getenv("CONTENT_BATCH_INGEST_SIZE", "100"))
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_requests(figures: List[Dict], fact_counts: Dict[int, int], combined: bool = True) -> List[Dict]:
+    """
+    One Batch API request line per missing piece of content.
+    custom_id is "<kind>:<figure id>" with kind content (story and facts
+    together), story or facts.
+    """
+    lines = []
+    for figure in figures:
+        needs_story = not figure["has_origin_story"]
+        needs_facts = fact_counts.get(figure["id"], 0) == 0
+        requests = []
+        if combined and needs_story and needs_facts:
+            requests.append(("content", _figure_content_request(figure)))
+        else:
+            if needs_story:
+                requests.append(("story", _origin_story_request(figure)))
+            if needs_facts:
+                requests.append(("facts", _fun_facts_request(figure)))
+        for kind, body in requests:
+            lines.append({
+                "custom_id": f"{kind}:{figure['id']}",
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body
+            })
+    return lines
+
+
+def write_batch_file(lines: List[Dict]) -> str:
+    """Write request lines to a JSONL file and return its path."""
+    os.makedirs(CONTENT_BATCH_DIR, exist_ok=True)
+    path = os.path.join(CONTENT_BATCH_DIR, f"content-{int(time.time())}-{uuid.uuid4().hex[:8]}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def _read_jsonl(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class OpenAIBatchBackend:
+    """The OpenAI Batch API (24h completion window, half-price tokens)."""
+
+    name = "openai"
+
+    async def submit(self, input_path: str) -> str:
+        client = await get_openai_client()
+        with open(input_path, "rb") as f:
+            input_file = await client.files.create(file=f, purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> Dict:
+        client = await get_openai_client()
+        batch = await client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "completed": counts.completed if counts else None,
+            "failed": counts.failed if counts else None,
+            "total": counts.total if counts else None
+        }
+
+    async def results(self, status: Dict) -> List[Dict]:
+        client = await get_openai_client()
+        lines = []
+        for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+            if file_id:
+                content = await client.files.content(file_id)
+                lines.extend(json.loads(line) for line in content.text.splitlines() if line.strip())
+        return lines
+
+
+class LocalBatchBackend:
+    """File-based stand-in for the Batch API; completes at once with placeholder content."""
+
+    name = "local"
+
+    def _dir(self, batch_id: str) -> str:
+        return os.path.join(CONTENT_BATCH_DIR, batch_id)
+
+    @staticmethod
+    def _fake_content(body: Dict) -> str:
+        prompt = body["messages"][-1]["content"]
+        subject = prompt.split(" about ")[-1].split(" for ")[-1].split(" from Greek")[0]
+        facts = [
+            {"content": f"Placeholder {category} fact about {subject}.", "category": category, "surprise_factor": 3}
+            for category in ("linguistic", "mythological", "cultural", "historical")
+        ]
+        schema_name = (body.get("response_format") or {}).get("json_schema", {}).get("name")
+        if schema_name == "figure_content":
+            return json.dumps({"origin_story": f"Placeholder origin story of {subject}.", "fun_facts": facts})
+        if schema_name == "fun_facts":
+            return json.dumps({"facts": facts})
+        return f"Placeholder origin story of {subject}."
+
+    async def submit(self, input_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._dir(batch_id))
+        with open(os.path.join(self._dir(batch_id), "output.jsonl"), "w", encoding="utf-8") as out:
+            for request in _read_jsonl(input_path):
+                content = self._fake_content(request["body"])
+                out.write(json.dumps({
+                    "id": f"req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {
+                            "model": request["body"]["model"],
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": content}}],
+                            "usage": {"prompt_tokens": len(json.dumps(request["body"])) // 4,
+                                      "completion_tokens": len(content) // 4}
+                        }
+                    },
+                    "error": None
+                }, ensure_ascii=False) + "\n")
+        return batch_id
+
+    async def status(self, batch_id: str) -> Dict:
+        output = os.path.join(self._dir(batch_id), "output.jsonl")
+        if not os.path.exists(output):
+            return {"status": "failed", "output_file_id": None, "error_file_id": None}
+        return {"status": "completed", "output_file_id": output, "error_file_id": None}
+
+    async def results(self, status: Dict) -> List[Dict]:
+        return _read_jsonl(status["output_file_id"])
+
+
+def get_backend(name: Optional[str] = None):
+    """
+    The backend to submit to: `name` (e.g. a request override) or
+    CONTENT_BATCH_BACKEND. The local fake writes placeholder content, so
+    only the server-side setting can select it.
+    """
+    name = name or CONTENT_BATCH_BACKEND
+    if name == "local":
+        if CONTENT_BATCH_BACKEND != "local":
+            raise ValueError("The local batch backend requires CONTENT_BATCH_BACKEND=local")
+        return LocalBatchBackend()
+    if name == "openai":
+        return OpenAIBatchBackend()
+    raise ValueError(f"Unknown content batch backend: {name}")
+
+
+def _parse_result(line: Dict, requests: Dict[str, Dict], seed_cache: bool) -> Tuple[str, int, Dict]:
+    """
+    Validate one output line. Returns (kind, figure_id, {"origin_story"?, "fun_facts"?}).
+    Raises ValueError for failed or malformed results.
+    """
+    kind, _, figure_id = line["custom_id"].partition(":")
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        error = line.get("error") or response.get("body", {}).get("error") or response.get("status_code")
+        raise ValueError(f"Batch request failed: {error}")
+
+    body = response["body"]
+    content = body["choices"][0]["message"]["content"]
+    usage = body.get("usage") or {}
+    metrics.record_call(
+        "openai", "batch.chat.completions", body.get("model", "gpt-4o"), 0,
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        batch=True
+    )
+
+    if kind == "content":
+        parsed = parse_figure_content(content)
+    elif kind == "story":
+        parsed = {"origin_story": parse_origin_story(content)}
+    else:
+        parsed = {"fun_facts": parse_fun_facts(content)}
+
+    # Seed the response cache so interactive regeneration replays this result
+    # (complete responses only, as create_chat_completion does)
+    request = requests.get(line["custom_id"])
+    complete = body["choices"][0].get("finish_reason") == "stop"
+    if seed_cache and complete and request and cache.CONTENT_CACHE_ENABLED:
+        cache.put(cache.cache_key(**request["body"]), content, request["body"].get("model"))
+    return kind, int(figure_id), parsed
+
+
+def _save_chunk(
+    job_id: int,
+    stories: Dict[int, str],
+    facts: Dict[int, List[Dict]],
+    succeeded: Dict[str, Dict]
+) -> Dict[str, int]:
+    get_engine()
+    with SessionLocal() as db:
+        # Checkpoints commit with the content they record
+        jobs.stage_items_succeeded(db, job_id, succeeded)
+        return crud.save_generated_content(db, stories, facts, skip_existing=True)
+
+
+async def ingest_results(
+    job_id: int,
+    lines: List[Dict],
+    requests: Dict[str, Dict],
+    seed_cache: bool = True
+) -> Dict:
+    """Write validated results in CONTENT_BATCH_INGEST_SIZE-figure transactions, checkpointing each."""
+    summary = {"origin_stories_created": 0, "fun_facts_created": 0, "failed": 0, "errors": []}
+
+    # A figure can have a story line and a facts line; keep them in one chunk
+    by_figure: Dict[str, List[Dict]] = {}
+    for line in lines:
+        by_figure.setdefault(str(line.get("custom_id")).partition(":")[2], []).append(line)
+    groups = list(by_figure.values())
+
+    for start in range(0, len(groups), max(1, CONTENT_BATCH_INGEST_SIZE)):
+        chunk = [line for group in groups[start:start + CONTENT_BATCH_INGEST_SIZE] for line in group]
+        stories, facts, succeeded = {}, {}, {}
+        for line in chunk:
+            try:
+                kind, figure_id, parsed = await asyncio.to_thread(_parse_result, line, requests, seed_cache)
+            except Exception as e:
+                summary["failed"] += 1
+                summary["errors"].append({"custom_id": line.get("custom_id"), "error": str(e)})
+                await run_db(jobs.mark_item_failed, job_id, line.get("custom_id"), str(e))
+                continue
+            if "origin_story" in parsed:
+                stories[figure_id] = parsed["origin_story"]
+            if "fun_facts" in parsed:
+                facts[figure_id] = parsed["fun_facts"]
+            succeeded[line["custom_id"]] = {"kind": kind}
+
+        saved = await run_db(_save_chunk, job_id, stories, facts, succeeded)
+        summary["origin_stories_created"] += saved["origin_stories"]
+        summary["fun_facts_created"] += saved["fun_facts"]
+
+    return summary
+
+
+async def start_content_batch(
+    figures: List[Dict],
+    fact_counts: Dict[int, int],
+    combined: bool = True,
+    backend: Optional[str] = None
+) -> Dict:
+    """
+    Create or resume the content batch job and submit the JSONL if needed.
+    Returns {"job_id", "batch_id", "backend", "requests", "resumed"}; job_id
+    and batch_id are None when no content is missing.
+    Raises jobs.JobInProgress if another worker is polling a batch.
+    """
+    backend_impl = get_backend(backend)
+    lines = build_batch_requests(figures, fact_counts, combined)
+    if not lines:
+        return {"job_id": None, "batch_id": None, "backend": backend_impl.name,
+                "requests": 0, "resumed": False}
+    job = await run_db(
+        jobs.start_or_resume_job, JOB_KIND, [line["custom_id"] for line in lines],
+        {"backend": backend_impl.name, "combined": combined}
+    )
+
+    params = job["params"]
+    if job["resumed"] and params.get("batch_id"):
+        return {"job_id": job["job_id"], "batch_id": params["batch_id"], "backend": params["backend"],
+                "requests": len(job["pending"]), "resumed": True}
+
+    pending = set(job["pending"])
+    input_path = write_batch_file([line for line in lines if line["custom_id"] in pending])
+    try:
+        batch_id = await backend_impl.submit(input_path)
+    except Exception as e:
+        # Close the job so the next request can submit again instead of getting 409
+        await run_db(jobs.fail_job, job["job_id"], f"Batch submission failed: {e}")
+        raise
+    await run_db(jobs.update_job_params, job["job_id"], {"batch_id": batch_id, "input_path": input_path})
+    return {"job_id": job["job_id"], "batch_id": batch_id, "backend": backend_impl.name,
+            "requests": len(pending), "resumed": job["resumed"]}
+
+
+async def wait_and_ingest(job_id: int, poll_seconds: float = CONTENT_BATCH_POLL_SECONDS) -> Dict:
+    """Poll the job's batch until it finishes, then ingest its results and close the job."""
+    status = await run_db(jobs.get_job_status, JOB_KIND)
+    params = status["params"]
+    backend_impl = get_backend(params["backend"])
+
+    while True:
+        batch_status = await backend_impl.status(params["batch_id"])
+        # Keep the job's heartbeat fresh so other workers do not take it over
+        await run_db(jobs.touch_job, job_id)
+        if batch_status["status"] in TERMINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_seconds)
+
+    has_output = batch_status.get("output_file_id") or batch_status.get("error_file_id")
+    lines = await backend_impl.results(batch_status) if has_output else []
+    # The submitted file only seeds the response cache; it is gone if this
+    # worker is not the one that submitted
+    input_path = params.get("input_path")
+    requests = {r["custom_id"]: r for r in _read_jsonl(input_path)} if input_path and os.path.exists(input_path) else {}
+
+    # Placeholder results from the local fake must not be replayed as real responses
+    summary = await ingest_results(job_id, lines, requests, seed_cache=backend_impl.name == "openai")
+    
+    # Items the batch never answered (failed or expired batch, or added to the
+    # job after submission) are retried on the next submission
+    summary["failed"] += await run_db(
+        jobs.fail_unfinished_items, job_id, f"No result (batch {batch_status['status']})"
+    )
+    
+    final_status = await run_db(jobs.finish_job, job_id)
+    summary.update({"batch_id": params["batch_id"], "batch_status": batch_status["status"], "job_status": final_status})
+    return summary
@@ -0,0 +1,142 @@
+"""
+Persistent cache of LLM responses in a local SQLite file.
+Keyed on everything that determines a completion (model, messages,
+temperature, max_tokens, response format), with TTL expiry and LRU
+eviction beyond a maximum entry count.
+
+All functions are blocking; async callers use a thread. get() and put()
+fail open: a broken cache file never stops content generation.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from contextlib import closing
+from typing import Optional
+
+CONTENT_CACHE_ENABLED = os.getenv("CONTENT_CACHE_ENABLED", "1") == "1"
+CONTENT_CACHE_PATH = os.getenv(
+    "CONTENT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "etymython-llm-cache.sqlite3")
+)
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", str(30 * 24 * 3600)))  # seconds; 0 = never expire
+CONTENT_CACHE_MAX_ENTRIES = int(os.getenv("CONTENT_CACHE_MAX_ENTRIES", "5000"))
+# Replay only: a cache miss raises instead of calling the API (tests, offline dev)
+CONTENT_CACHE_REPLAY_ONLY = os.getenv("CONTENT_CACHE_REPLAY_ONLY", "0") == "1"
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+class CacheMiss(LookupError):
+    """Raised in replay-only mode when a request has no cached response."""
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    connection = sqlite3.connect(CONTENT_CACHE_PATH, timeout=10)
+    if not _initialized:
+        try:
+            with _init_lock:
+                if not _initialized:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS responses ("
+                        " key TEXT PRIMARY KEY,"
+                        " model TEXT,"
+                        " content TEXT NOT NULL,"
+                        " created_at REAL NOT NULL,"
+                        " accessed_at REAL NOT NULL)"
+                    )
+                    connection.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)"
+                    )
+                    connection.commit()
+                    _initialized = True
+        except sqlite3.Error:
+            connection.close()
+            raise
+    return connection
+
+
+def cache_key(**request) -> str:
+    """SHA-256 of the request parameters that determine the completion."""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """
+    Cached content for `key`, or None if missing or expired. A cache that
+    cannot be read (locked, corrupt, disk full) also returns None, so the
+    caller falls through to the API.
+    """
+    now = time.time()
+    try:
+        with closing(_connect()) as connection:
+            row = connection.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if CONTENT_CACHE_TTL and now - created_at > CONTENT_CACHE_TTL:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                connection.commit()
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+            return content
+    except sqlite3.Error as e:
+        print(f"LLM cache read failed ({e}); calling the API")
+        return None
+
+
+def put(key: str, content: str, model: Optional[str] = None):
+    """Store a response, then drop expired and least recently used entries. Failures are logged, not raised."""
+    now = time.time()
+    try:
+        with closing(_connect()) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, now, now)
+            )
+            if CONTENT_CACHE_TTL:
+                connection.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (now - CONTENT_CACHE_TTL,)
+                )
+            connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (CONTENT_CACHE_MAX_ENTRIES,)
+            )
+            connection.commit()
+    except sqlite3.Error as e:
+        print(f"LLM cache write failed: {e}")
+
+
+def clear() -> int:
+    """Remove every cached response. Returns the number removed."""
+    with closing(_connect()) as connection:
+        removed = connection.execute("DELETE FROM responses").rowcount
+        connection.commit()
+        return removed
+
+
+def stats() -> dict:
+    with closing(_connect()) as connection:
+        count, oldest = connection.execute(
+            "SELECT COUNT(*), MIN(created_at) FROM responses"
+        ).fetchone()
+    return {
+        "enabled": CONTENT_CACHE_ENABLED,
+        "replay_only": CONTENT_CACHE_REPLAY_ONLY,
+        "path": CONTENT_CACHE_PATH,
+        "entries": count,
+        "max_entries": CONTENT_CACHE_MAX_ENTRIES,
+        "ttl_seconds": CONTENT_CACHE_TTL,
+        "oldest_age_seconds": round(time.time() - oldest) if oldest else None
+    }
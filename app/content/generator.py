@@ -1,35 +1,86 @@
 """
 AI content generation using OpenAI GPT-4.
 Generates origin stories and fun facts for mythological figures.
+
+Completions go through a persistent response cache (app.content.cache), so
+identical prompts are replayed instead of re-paid; pass use_cache=False to
+force a fresh completion.
 """
 
 import os
-import json
-from openai import AsyncOpenAI
-from typing import Dict, List
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Type, TYPE_CHECKING
 
-async def get_openai_client() -> AsyncOpenAI:
-    """Get OpenAI client with API key from Secret Manager or environment."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    
-    if not api_key:
-        try:
-            from google.cloud import secretmanager
-            client = secretmanager.SecretManagerServiceClient()
-            name = "projects/etymython-project/secrets/openai-api-key/versions/latest"
-            response = client.access_secret_version(request={"name": name})
-            api_key = response.payload.data.decode("UTF-8").strip()
-        except Exception as e:
-            raise ValueError(f"OPENAI_API_KEY not found: {e}")
-    
-    return AsyncOpenAI(api_key=api_key)
+from pydantic import BaseModel, Field, ValidationError, field_validator
 
+from app import metrics
+from app.content import cache
+from app.openai_client import get_shared_openai_client
 
-async def generate_origin_story(figure: Dict) -> str:
-    """Generate an engaging origin story for a mythological figure."""
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Batch generation requests story and facts in one structured call by default
+CONTENT_COMBINED_GENERATION = os.getenv("CONTENT_COMBINED_GENERATION", "1") == "1"
+
+
+async def get_openai_client() -> "AsyncOpenAI":
+    """Get the shared OpenAI client (API key from Secret Manager or environment)."""
+    try:
+        return get_shared_openai_client()
+    except Exception as e:
+        raise ValueError(f"OPENAI_API_KEY not found: {e}")
+
+
+async def create_chat_completion(
+    use_cache: bool = True,
+    parse: Optional[Callable[[str], Any]] = None,
+    **request
+) -> Any:
+    """
+    Chat completion for `request` (model, messages, temperature, max_tokens,
+    response_format), served from the response cache when possible.
+
+    Returns parse(content) when `parse` is given, else the content. Only a
+    complete response (finish_reason "stop") that `parse` accepts is cached,
+    so a malformed or truncated one is never replayed.
+    """
+    parse = parse or (lambda content: content)
+    use_cache = use_cache and cache.CONTENT_CACHE_ENABLED
+    key = cache.cache_key(**request)
+    if use_cache:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            try:
+                parsed = parse(cached)
+            except ValueError:
+                pass  # stored before responses were validated; fetch a fresh one
+            else:
+                metrics.record_call("openai", "chat.completions", request.get("model"), 0, cached=True)
+                return parsed
+        if cache.CONTENT_CACHE_REPLAY_ONLY:
+            raise cache.CacheMiss(f"No cached response for {request.get('model')} request {key[:12]}")
     
     client = await get_openai_client()
+    with metrics.track("openai", "chat.completions", request.get("model")) as usage:
+        response = await client.chat.completions.create(**request)
+        if response.usage:
+            usage["prompt_tokens"] = response.usage.prompt_tokens
+            usage["completion_tokens"] = response.usage.completion_tokens
+    choice = response.choices[0]
+    message = choice.message
+    if getattr(message, "refusal", None):
+        raise ValueError(f"Model refused the request: {message.refusal}")
     
+    parsed = parse(message.content)
+    if use_cache and choice.finish_reason == "stop":
+        await asyncio.to_thread(cache.put, key, message.content, request.get("model"))
+    return parsed
+
+
+def _origin_story_request(figure: Dict) -> Dict:
+    """Chat completion parameters for a figure's origin story."""
     prompt = f"""Write a compelling 2-3 paragraph origin story for {figure['english_name']} ({figure.get('greek_name', '')}) from Greek mythology.
 
 Figure details:
@@ -46,62 +97,275 @@ Requirements:
 - 150-250 words
 - Do NOT include the figure's name in the first sentence - start with an interesting hook"""
 
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    return {
+        "model": "gpt-4o",
+        "messages": [
             {"role": "system", "content": "You are a classical mythology scholar writing engaging educational content."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=500,
-        temperature=0.7
-    )
+        "max_tokens": 500,
+        "temperature": 0.7
+    }
+
+
+def parse_origin_story(content: str) -> str:
+    """Stripped story text; an empty response is an error."""
+    story = (content or "").strip()
+    if not story:
+        raise ValueError("The model returned an empty origin story")
+    return story
+
+
+async def generate_origin_story(figure: Dict, use_cache: bool = True) -> str:
+    """Generate an engaging origin story for a mythological figure."""
     
-    return response.choices[0].message.content.strip()
+    return await create_chat_completion(
+        use_cache=use_cache, parse=parse_origin_story, **_origin_story_request(figure)
+    )
 
 
-async def generate_fun_facts(figure: Dict) -> List[Dict]:
-    """Generate 3-5 fun facts about a mythological figure."""
+async def stream_origin_story(figure: Dict, use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    Yield an origin story's text as it is generated.
+    A cached story is yielded in one piece; a streamed one is cached once complete.
+    """
+    request = _origin_story_request(figure)
+    use_cache = use_cache and cache.CONTENT_CACHE_ENABLED
+    key = cache.cache_key(**request)
+    if use_cache:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            metrics.record_call("openai", "chat.completions.stream", request["model"], 0, cached=True)
+            yield cached
+            return
     
     client = await get_openai_client()
+    parts = []
+    usage = {}
+    # Latency counts time spent waiting on OpenAI, not on our consumer at `yield`
+    upstream_seconds = 0.0
+    stream = None
+    finish_reason = None
+    try:
+        started = time.perf_counter()
+        stream = await client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **request
+        )
+        chunks = stream.__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                upstream_seconds += time.perf_counter() - started
+            if chunk.usage:
+                usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                usage["completion_tokens"] = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            text = chunk.choices[0].delta.content
+            if text:
+                parts.append(text)
+                yield text
+    except Exception as e:
+        if stream is None:
+            upstream_seconds = time.perf_counter() - started
+        metrics.record_call(
+            "openai", "chat.completions.stream", request["model"], upstream_seconds * 1000,
+            error_class=type(e).__name__, **usage
+        )
+        raise
+    except BaseException:
+        # Consumer went away (disconnect or cancel): not a provider error
+        metrics.record_call("openai", "chat.completions.stream", request["model"], 0, cancelled=True, **usage)
+        raise
+    finally:
+        if stream is not None:
+            # Closing the stream aborts the upstream request if we stopped early
+            await stream.close()
+    metrics.record_call(
+        "openai", "chat.completions.stream", request["model"], upstream_seconds * 1000, **usage
+    )
     
-    prompt = f"""Generate 4 fascinating fun facts about {figure['english_name']} ({figure.get('greek_name', '')}) from Greek mythology.
+    # A truncated or empty story is not replayed
+    if use_cache and finish_reason == "stop" and "".join(parts).strip():
+        await asyncio.to_thread(cache.put, key, "".join(parts), request["model"])
 
-Figure details:
-- Role: {figure.get('role', 'Unknown')}
-- Domain: {figure.get('domain', 'Unknown')}
-- Symbols: {figure.get('symbols', 'Unknown')}
 
-Requirements:
-- Include at least ONE etymology/linguistic fact (English words derived from their name)
+class FunFactItem(BaseModel):
+    content: str
+    category: Literal["linguistic", "mythological", "cultural", "historical"]
+    surprise_factor: int = Field(ge=1, le=5)
+
+    @field_validator("surprise_factor", mode="before")
+    @classmethod
+    def _clamp_surprise_factor(cls, value):
+        # Strict mode cannot bound integers; one fact's score must not reject the response
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return min(5, max(1, int(value)))
+        return value
+
+
+class FunFactList(BaseModel):
+    facts: List[FunFactItem] = Field(min_length=1)
+
+
+class FigureContent(BaseModel):
+    origin_story: str = Field(min_length=1)
+    fun_facts: List[FunFactItem] = Field(min_length=1)
+
+
+# JSON schemas for structured output (strict mode: every field required, no extras)
+_FUN_FACT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "content": {"type": "string"},
+        "category": {"type": "string", "enum": ["linguistic", "mythological", "cultural", "historical"]},
+        "surprise_factor": {"type": "integer", "description": "1-5, how surprising or memorable"}
+    },
+    "required": ["content", "category", "surprise_factor"],
+    "additionalProperties": False
+}
+
+FUN_FACTS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "fun_facts",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"facts": {"type": "array", "items": _FUN_FACT_SCHEMA}},
+            "required": ["facts"],
+            "additionalProperties": False
+        }
+    }
+}
+
+FIGURE_CONTENT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "figure_content",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "origin_story": {"type": "string"},
+                "fun_facts": {"type": "array", "items": _FUN_FACT_SCHEMA}
+            },
+            "required": ["origin_story", "fun_facts"],
+            "additionalProperties": False
+        }
+    }
+}
+
+FUN_FACT_REQUIREMENTS = """- Include at least ONE etymology/linguistic fact (English words derived from their name)
 - Include at least ONE surprising or lesser-known mythological fact
 - Include at least ONE cultural impact fact (art, literature, modern references)
 - Each fact should be 1-2 sentences
 - Be accurate to classical sources
 - Make them memorable and "did you know?" worthy
+- "category" is one of "linguistic", "mythological", "cultural", "historical"
+- "surprise_factor" is 1-5 (how surprising/memorable)"""
+
+
+def _parse_structured(content: str, model: Type[BaseModel]) -> BaseModel:
+    """Validate a structured-output response against `model`."""
+    try:
+        return model.model_validate_json(content)
+    except ValidationError as e:
+        raise ValueError(f"Response did not match the {model.__name__} schema: {e}")
+
 
-Return as JSON array with objects containing:
-- "content": the fact text
-- "category": one of "linguistic", "mythological", "cultural", "historical"
-- "surprise_factor": 1-5 (how surprising/memorable)"""
+def _fun_facts_request(figure: Dict) -> Dict:
+    """Chat completion parameters for a figure's fun facts."""
+    prompt = f"""Generate 4 fascinating fun facts about {figure['english_name']} ({figure.get('greek_name', '')}) from Greek mythology.
 
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a classical mythology scholar. Return ONLY valid JSON, no markdown."},
+Figure details:
+- Role: {figure.get('role', 'Unknown')}
+- Domain: {figure.get('domain', 'Unknown')}
+- Symbols: {figure.get('symbols', 'Unknown')}
+
+Requirements:
+{FUN_FACT_REQUIREMENTS}"""
+
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": "You are a classical mythology scholar."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=600,
-        temperature=0.7
+        "max_tokens": 600,
+        "temperature": 0.7,
+        "response_format": FUN_FACTS_RESPONSE_FORMAT
+    }
+
+
+def parse_fun_facts(content: str) -> List[Dict]:
+    """Validate a fun facts response; returns the fact dicts."""
+    parsed = _parse_structured(content, FunFactList)
+    return [fact.model_dump() for fact in parsed.facts]
+
+
+async def generate_fun_facts(figure: Dict, use_cache: bool = True) -> List[Dict]:
+    """Generate 3-5 fun facts about a mythological figure."""
+    
+    return await create_chat_completion(
+        use_cache=use_cache, parse=parse_fun_facts, **_fun_facts_request(figure)
     )
+
+
+def _figure_content_request(figure: Dict) -> Dict:
+    """Chat completion parameters for a figure's combined story and facts."""
+    prompt = f"""Write content about {figure['english_name']} ({figure.get('greek_name', '')}) from Greek mythology.
+
+Figure details:
+- Role: {figure.get('role', 'Unknown')}
+- Domain: {figure.get('domain', 'Unknown')}
+- Symbols: {figure.get('symbols', 'Unknown')}
+- Type: {figure.get('figure_type', 'Unknown')}
+
+"origin_story": a compelling 2-3 paragraph origin story.
+- Be accurate to classical Greek mythology (Hesiod, Homer, Ovid)
+- Include their birth/creation and key mythological events
+- Mention their parents if known
+- Keep it engaging but educational
+- 150-250 words
+- Do NOT include the figure's name in the first sentence - start with an interesting hook
+
+"fun_facts": 4 fascinating fun facts.
+{FUN_FACT_REQUIREMENTS}"""
+
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": "You are a classical mythology scholar writing engaging educational content."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 1100,
+        "temperature": 0.7,
+        "response_format": FIGURE_CONTENT_RESPONSE_FORMAT
+    }
+
+
+def parse_figure_content(content: str) -> Dict:
+    """Validate a combined response; returns {"origin_story", "fun_facts"}."""
+    parsed = _parse_structured(content, FigureContent)
+    return {
+        "origin_story": parsed.origin_story.strip(),
+        "fun_facts": [fact.model_dump() for fact in parsed.fun_facts]
+    }
+
+
+async def generate_figure_content(figure: Dict, use_cache: bool = True) -> Dict:
+    """
+    Generate the origin story and fun facts in one structured-output call.
+    Shares the figure context between both, halving prompt tokens and round trips.
+    Returns {"origin_story": str, "fun_facts": [dict]}.
+    """
     
-    try:
-        content = response.choices[0].message.content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            lines = content.split("\n")
-            content = "\n".join(lines[1:-1])  # Remove first and last lines
-            if content.startswith("json"):
-                content = content[4:].strip()
-        return json.loads(content)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Could not parse fun facts JSON: {e}")
+    return await create_chat_completion(
+        use_cache=use_cache, parse=parse_figure_content, **_figure_content_request(figure)
+    )
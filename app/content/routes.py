@@ -1,16 +1,39 @@
 """Content generation API routes."""
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
+import asyncio
+import json
+import os
 
-from app.database import get_db
-from app import models
-from app.content.generator import generate_origin_story, generate_fun_facts
+from app.database import SessionLocal, get_db, get_engine, run_db
+from app import models, crud, jobs, status
+from app.content import cache
+from app.content import batch as content_batch
+from app.content.generator import (
+    CONTENT_COMBINED_GENERATION,
+    generate_origin_story,
+    generate_fun_facts,
+    generate_figure_content,
+    stream_origin_story
+)
 
 router = APIRouter(prefix="/api/v1/content", tags=["content"])
 
+# Figures generated at once by generate-all, and figures written per commit
+CONTENT_BATCH_CONCURRENCY = int(os.getenv("CONTENT_BATCH_CONCURRENCY", "4"))
+CONTENT_COMMIT_BATCH_SIZE = int(os.getenv("CONTENT_COMMIT_BATCH_SIZE", "10"))
+
+# Streaming client disconnects: "cancel" the upstream request, or "finish" and save anyway
+CONTENT_STREAM_ON_DISCONNECT = os.getenv("CONTENT_STREAM_ON_DISCONNECT", "finish")
+
+# Streams left running after their client disconnected (kept referenced until done)
+_background_streams = set()
+
 
 class OriginStoryResponse(BaseModel):
     figure_id: int
@@ -27,6 +50,8 @@ class FunFactResponse(BaseModel):
 
 
 class BatchContentResponse(BaseModel):
+    job_id: Optional[int] = None
+    resumed: bool = False
     total: int
     origin_stories_created: int
     fun_facts_created: int
@@ -44,18 +69,66 @@ class UpdateFunFactRequest(BaseModel):
     surprise_factor: Optional[int] = None
 
 
+def _figure_data(figure: models.MythologicalFigure) -> dict:
+    """Snapshot the fields the generators need (safe to use after commit)."""
+    return {
+        "id": figure.id,
+        "english_name": figure.english_name,
+        "greek_name": figure.greek_name,
+        "role": figure.role,
+        "domain": figure.domain,
+        "symbols": figure.symbols,
+        "figure_type": figure.figure_type,
+        "has_origin_story": bool(figure.origin_story)
+    }
+
+
+def _save_origin_story(db: Session, figure_id: int, origin_story: str):
+    figure = db.get(models.MythologicalFigure, figure_id)
+    figure.origin_story = origin_story
+    db.commit()
+
+
+def _count_fun_facts(db: Session, figure_id: int) -> int:
+    return db.query(models.FunFact).filter(
+        models.FunFact.figure_id == figure_id
+    ).count()
+
+
+def _save_fun_facts(db: Session, figure_id: int, facts: List[dict]) -> int:
+    db.add_all([crud.generated_fun_fact(figure_id, fact) for fact in facts])
+    db.commit()
+    return len(facts)
+
+
+def _save_content(
+    db: Session,
+    stories: Dict[int, str],
+    facts: Dict[int, List[dict]],
+    job_id: int,
+    checkpoints: Dict[str, dict]
+):
+    """Save several figures' content and their job checkpoints in one commit."""
+    jobs.stage_items_succeeded(db, job_id, checkpoints)
+    crud.save_generated_content(db, stories, facts)
+
+
+def _list_figure_data(db: Session) -> List[dict]:
+    return [_figure_data(f) for f in db.query(models.MythologicalFigure).all()]
+
+
 @router.post("/generate-origin-story/{figure_id}", response_model=OriginStoryResponse)
 async def generate_origin_story_for_figure(
     figure_id: int,
+    use_cache: bool = True,
     db: Session = Depends(get_db)
 ):
     """
     Generate an origin story for a specific figure using OpenAI GPT-4.
+    Identical prompts replay the cached response; pass use_cache=false for a fresh one.
     """
     # Get figure
-    figure = db.query(models.MythologicalFigure).filter(
-        models.MythologicalFigure.id == figure_id
-    ).first()
+    figure = await run_db(crud.get_figure, db, figure_id)
     
     if not figure:
         raise HTTPException(status_code=404, detail="Figure not found")
@@ -66,26 +139,18 @@ async def generate_origin_story_for_figure(
             detail=f"Figure {figure.english_name} already has an origin story"
         )
     
+    figure_data = _figure_data(figure)
+    
     try:
         # Generate origin story
-        figure_data = {
-            "english_name": figure.english_name,
-            "greek_name": figure.greek_name,
-            "role": figure.role,
-            "domain": figure.domain,
-            "symbols": figure.symbols,
-            "figure_type": figure.figure_type
-        }
-        
-        origin_story = await generate_origin_story(figure_data)
+        origin_story = await generate_origin_story(figure_data, use_cache=use_cache)
         
         # Update database
-        figure.origin_story = origin_story
-        db.commit()
+        await run_db(_save_origin_story, db, figure_id, origin_story)
         
         return OriginStoryResponse(
-            figure_id=figure.id,
-            figure_name=figure.english_name,
+            figure_id=figure_id,
+            figure_name=figure_data["english_name"],
             origin_story=origin_story,
             message="Origin story generated successfully"
         )
@@ -97,26 +162,113 @@ async def generate_origin_story_for_figure(
         )
 
 
+def _save_origin_story_in_new_session(figure_id: int, origin_story: str):
+    # The request's session may already be closed when a stream finishes
+    get_engine()
+    with SessionLocal() as db:
+        _save_origin_story(db, figure_id, origin_story)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _produce_origin_story(figure_data: dict, use_cache: bool, queue: asyncio.Queue):
+    """Read the upstream stream into `queue` and save the story once complete."""
+    try:
+        parts = []
+        async for text in stream_origin_story(figure_data, use_cache=use_cache):
+            parts.append(text)
+            queue.put_nowait(("token", {"text": text}))
+        origin_story = "".join(parts).strip()
+        if not origin_story:
+            # Saving "" would count the figure as having a story
+            queue.put_nowait(("error", {"detail": "Content generation failed: the model returned an empty story"}))
+            return
+        await run_db(_save_origin_story_in_new_session, figure_data["id"], origin_story)
+        queue.put_nowait(("done", {
+            "figure_id": figure_data["id"],
+            "figure_name": figure_data["english_name"],
+            "origin_story": origin_story,
+            "message": "Origin story generated successfully"
+        }))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        queue.put_nowait(("error", {"detail": f"Content generation failed: {str(e)}"}))
+
+
+@router.post("/generate-origin-story/{figure_id}/stream")
+async def stream_origin_story_for_figure(
+    figure_id: int,
+    use_cache: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Generate an origin story and stream it as Server-Sent Events.
+    Emits "token" events as text arrives, then "done" with the saved story
+    (or "error"). If the client disconnects, the upstream request is cancelled
+    or finished and saved, per CONTENT_STREAM_ON_DISCONNECT.
+    """
+    figure = await run_db(crud.get_figure, db, figure_id)
+    
+    if not figure:
+        raise HTTPException(status_code=404, detail="Figure not found")
+    
+    if figure.origin_story:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Figure {figure.english_name} already has an origin story"
+        )
+    
+    figure_data = _figure_data(figure)
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_produce_origin_story(figure_data, use_cache, queue))
+    
+    async def events():
+        while True:
+            event, data = await queue.get()
+            yield _sse(event, data)
+            if event in ("done", "error"):
+                return
+    
+    async def after_response():
+        # Runs once the response ends, including on client disconnect; the
+        # producer is still running only if the client went away mid-stream
+        if producer.done():
+            return
+        if CONTENT_STREAM_ON_DISCONNECT == "cancel":
+            producer.cancel()
+        else:
+            _background_streams.add(producer)
+            producer.add_done_callback(_background_streams.discard)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(after_response)
+    )
+
+
 @router.post("/generate-fun-facts/{figure_id}", response_model=FunFactResponse)
 async def generate_fun_facts_for_figure(
     figure_id: int,
+    use_cache: bool = True,
     db: Session = Depends(get_db)
 ):
     """
     Generate fun facts for a specific figure using OpenAI GPT-4.
+    Identical prompts replay the cached response; pass use_cache=false for a fresh one.
     """
     # Get figure
-    figure = db.query(models.MythologicalFigure).filter(
-        models.MythologicalFigure.id == figure_id
-    ).first()
+    figure = await run_db(crud.get_figure, db, figure_id)
     
     if not figure:
         raise HTTPException(status_code=404, detail="Figure not found")
     
     # Check if fun facts already exist
-    existing_facts = db.query(models.FunFact).filter(
-        models.FunFact.figure_id == figure_id
-    ).count()
+    existing_facts = await run_db(_count_fun_facts, db, figure_id)
     
     if existing_facts > 0:
         raise HTTPException(
@@ -124,43 +276,24 @@ async def generate_fun_facts_for_figure(
             detail=f"Figure {figure.english_name} already has {existing_facts} fun facts"
         )
     
+    figure_data = _figure_data(figure)
+    
     try:
         # Generate fun facts
-        figure_data = {
-            "english_name": figure.english_name,
-            "greek_name": figure.greek_name,
-            "role": figure.role,
-            "domain": figure.domain,
-            "symbols": figure.symbols,
-            "figure_type": figure.figure_type
-        }
-        
-        facts = await generate_fun_facts(figure_data)
+        facts = await generate_fun_facts(figure_data, use_cache=use_cache)
         
         # Insert into database
-        facts_created = 0
-        for fact in facts:
-            fun_fact = models.FunFact(
-                figure_id=figure_id,
-                content=fact.get('content', ''),
-                category=fact.get('category', 'mythological'),
-                surprise_factor=fact.get('surprise_factor', 3),
-                source_citation='Generated by AI based on classical sources'
-            )
-            db.add(fun_fact)
-            facts_created += 1
-        
-        db.commit()
+        facts_created = await run_db(_save_fun_facts, db, figure_id, facts)
         
         return FunFactResponse(
-            figure_id=figure.id,
-            figure_name=figure.english_name,
+            figure_id=figure_id,
+            figure_name=figure_data["english_name"],
             facts_created=facts_created,
             message=f"Generated {facts_created} fun facts successfully"
         )
         
     except Exception as e:
-        db.rollback()
+        await run_db(db.rollback)
         raise HTTPException(
             status_code=500,
             detail=f"Content generation failed: {str(e)}"
@@ -169,112 +302,231 @@ async def generate_fun_facts_for_figure(
 
 @router.post("/generate-all", response_model=BatchContentResponse)
 async def generate_content_for_all_figures(
+    combined: bool = CONTENT_COMBINED_GENERATION,
+    use_cache: bool = True,
     db: Session = Depends(get_db)
 ):
     """
     Generate origin stories and fun facts for all figures.
     WARNING: This is expensive (uses GPT-4) and takes time.
+    Figures run up to CONTENT_BATCH_CONCURRENCY at a time, with each figure's
+    story and facts requested in one structured call (combined, the default)
+    or as two parallel calls. Results are committed every
+    CONTENT_COMMIT_BATCH_SIZE figures, in the same transaction as their job
+    checkpoints; an interrupted run resumes with the figures whose batch was
+    not committed.
     """
     # Get all figures
-    figures = db.query(models.MythologicalFigure).all()
-    
-    results = {
-        "total": len(figures),
-        "origin_stories_created": 0,
-        "fun_facts_created": 0,
-        "failed": 0,
-        "details": []
-    }
+    figures = await run_db(_list_figure_data, db)
+    
+    try:
+        job = await run_db(jobs.start_or_resume_job, "content", [str(f["id"]) for f in figures])
+    except jobs.JobInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    job_id = job["job_id"]
+    pending = set(job["pending"])
+    figures = [f for f in figures if str(f["id"]) in pending]
+    
+    # One grouped query instead of a count() per figure
+    fact_counts = await run_db(crud.get_fun_fact_counts, db)
+    
+    semaphore = asyncio.Semaphore(max(1, CONTENT_BATCH_CONCURRENCY))
+    commit_lock = asyncio.Lock()
+    buffer = {"stories": {}, "facts": {}, "results": {}}
+    created = {"origin_stories": 0, "fun_facts": 0}
+    flush_errors: Dict[str, str] = {}  # figure key -> error for batches that failed to commit
+    
+    async def flush():
+        # Swap the buffer out before awaiting so other tasks keep appending
+        stories, facts, checkpoints = buffer["stories"], buffer["facts"], buffer["results"]
+        buffer["stories"], buffer["facts"], buffer["results"] = {}, {}, {}
+        if not (stories or facts or checkpoints):
+            return
+        try:
+            await run_db(_save_content, db, stories, facts, job_id, checkpoints)
+        except Exception as e:
+            # The content and checkpoints were rolled back together; fail the
+            # batch's figures so a resume retries them
+            await run_db(db.rollback)
+            created["origin_stories"] -= len(stories)
+            created["fun_facts"] -= sum(len(f) for f in facts.values())
+            error = f"Saving results failed: {e}"
+            for key in checkpoints:
+                flush_errors[key] = error
+                await run_db(jobs.mark_item_failed, job_id, key, error)
     
-    for figure in figures:
+    async def run_one(figure_data: dict) -> dict:
+        figure_id = figure_data["id"]
+        key = str(figure_id)
+        existing_facts = fact_counts.get(figure_id, 0)
         detail = {
-            "figure_id": figure.id,
-            "figure_name": figure.english_name,
-            "origin_story": "skipped",
-            "fun_facts": "skipped"
+            "figure_id": figure_id,
+            "figure_name": figure_data["english_name"],
+            "origin_story": "exists" if figure_data["has_origin_story"] else "skipped",
+            "fun_facts": f"exists ({existing_facts})" if existing_facts else "skipped"
         }
         
-        try:
-            figure_data = {
-                "english_name": figure.english_name,
-                "greek_name": figure.greek_name,
-                "role": figure.role,
-                "domain": figure.domain,
-                "symbols": figure.symbols,
-                "figure_type": figure.figure_type
-            }
+        async with semaphore:
+            await run_db(jobs.mark_item_running, job_id, key)
             
-            # Generate origin story if missing
-            if not figure.origin_story:
-                origin_story = await generate_origin_story(figure_data)
-                figure.origin_story = origin_story
-                db.commit()
-                results["origin_stories_created"] += 1
-                detail["origin_story"] = "generated"
+            if combined and not figure_data["has_origin_story"] and existing_facts == 0:
+                try:
+                    outcomes = await generate_figure_content(figure_data, use_cache=use_cache)
+                except Exception as e:
+                    outcomes = {"origin_story": e, "fun_facts": e}
             else:
-                detail["origin_story"] = "exists"
-            
-            # Generate fun facts if missing
-            existing_facts = db.query(models.FunFact).filter(
-                models.FunFact.figure_id == figure.id
-            ).count()
-            
-            if existing_facts == 0:
-                facts = await generate_fun_facts(figure_data)
-                for fact in facts:
-                    fun_fact = models.FunFact(
-                        figure_id=figure.id,
-                        content=fact.get('content', ''),
-                        category=fact.get('category', 'mythological'),
-                        surprise_factor=fact.get('surprise_factor', 3),
-                        source_citation='Generated by AI based on classical sources'
-                    )
-                    db.add(fun_fact)
-                db.commit()
-                results["fun_facts_created"] += len(facts)
+                # Story and facts are independent calls; run them side by side
+                calls = {}
+                if not figure_data["has_origin_story"]:
+                    calls["origin_story"] = generate_origin_story(figure_data, use_cache=use_cache)
+                if existing_facts == 0:
+                    calls["fun_facts"] = generate_fun_facts(figure_data, use_cache=use_cache)
+                outcomes = dict(zip(calls, await asyncio.gather(*calls.values(), return_exceptions=True)))
+        
+        errors = list(dict.fromkeys(str(v) for v in outcomes.values() if isinstance(v, Exception)))
+        async with commit_lock:
+            # Keep whichever half succeeded; a retry only regenerates what is missing
+            story = outcomes.get("origin_story")
+            if story is not None and not isinstance(story, Exception):
+                buffer["stories"][figure_id] = story
+                created["origin_stories"] += 1
+                detail["origin_story"] = "generated"
+            facts = outcomes.get("fun_facts")
+            if facts is not None and not isinstance(facts, Exception):
+                buffer["facts"][figure_id] = facts
+                created["fun_facts"] += len(facts)
                 detail["fun_facts"] = f"generated {len(facts)}"
-            else:
-                detail["fun_facts"] = f"exists ({existing_facts})"
             
+            if not errors:
+                buffer["results"][key] = {
+                    "origin_story": detail["origin_story"],
+                    "fun_facts": detail["fun_facts"]
+                }
+            if len(buffer["stories"].keys() | buffer["facts"].keys()) >= CONTENT_COMMIT_BATCH_SIZE:
+                await flush()
+        
+        if errors:
+            detail["status"] = "failed"
+            detail["error"] = "; ".join(errors)
+            await run_db(jobs.mark_item_failed, job_id, key, detail["error"])
+        else:
             detail["status"] = "success"
-            
-        except Exception as e:
-            results["failed"] += 1
+        return detail
+    
+    details = await asyncio.gather(*(run_one(f) for f in figures))
+    async with commit_lock:
+        await flush()
+    for detail in details:
+        error = flush_errors.get(str(detail["figure_id"]))
+        if error:
             detail["status"] = "failed"
-            detail["error"] = str(e)
-            db.rollback()
-        
-        results["details"].append(detail)
+            detail["error"] = error
+    await run_db(jobs.finish_job, job_id)
+    
+    return BatchContentResponse(
+        job_id=job_id,
+        resumed=job["resumed"],
+        total=len(figures),
+        origin_stories_created=created["origin_stories"],
+        fun_facts_created=created["fun_facts"],
+        failed=sum(1 for d in details if d["status"] == "failed"),
+        details=list(details)
+    )
+
+
+async def _run_content_batch(job_id: int):
+    """Background task: poll the submitted batch, then ingest its results."""
+    try:
+        summary = await content_batch.wait_and_ingest(job_id)
+        print(f"Content batch complete: {summary}")
+    except Exception as e:
+        print(f"Content batch error: {e}")
+
+
+@router.post("/generate-all/batch")
+async def generate_content_with_batch_api(
+    background_tasks: BackgroundTasks,
+    combined: bool = CONTENT_COMBINED_GENERATION,
+    backend: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Generate all missing content through the OpenAI Batch API (half price,
+    completes within 24h). Requests are submitted as one JSONL batch; a
+    background task polls it and ingests results in bulk transactions.
+    backend=openai overrides the server's CONTENT_BATCH_BACKEND; the offline
+    file-based fake is used only when CONTENT_BATCH_BACKEND=local.
+    """
+    figures = await run_db(_list_figure_data, db)
+    fact_counts = await run_db(crud.get_fun_fact_counts, db)
+    
+    try:
+        submitted = await content_batch.start_content_batch(figures, fact_counts, combined, backend)
+    except jobs.JobInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Batch submission failed: {e}")
+    
+    if submitted["job_id"] is None:
+        return {"message": "Nothing to generate: every figure has its content", **submitted}
     
-    return BatchContentResponse(**results)
+    background_tasks.add_task(_run_content_batch, submitted["job_id"])
+    return {
+        "message": f"{'Resumed' if submitted['resumed'] else 'Submitted'} batch of {submitted['requests']} requests",
+        "status_endpoint": "/api/v1/content/batch-status",
+        **submitted
+    }
+
+
+@router.get("/batch-status")
+def get_content_batch_status():
+    """Progress of the latest Batch API content job."""
+    return jobs.get_job_status(content_batch.JOB_KIND) or {"status": None, "total": 0}
+
+
+@router.get("/generate-status")
+def get_content_generation_status():
+    """Progress of the latest content batch (shared across workers)."""
+    return jobs.get_job_status("content") or {"status": None, "total": 0}
+
+
+@router.get("/cache")
+def get_response_cache_stats():
+    """LLM response cache size and settings."""
+    return cache.stats()
+
+
+@router.delete("/cache")
+def clear_response_cache():
+    """Drop every cached LLM response."""
+    return {"message": "Response cache cleared", "removed": cache.clear()}
 
 
 @router.get("/status")
-async def get_content_status(db: Session = Depends(get_db)):
+def get_content_status(db: Session = Depends(get_db)):
     """
     Get content generation status.
     """
-    total = db.query(models.MythologicalFigure).count()
-    with_origin_story = db.query(models.MythologicalFigure).filter(
-        models.MythologicalFigure.origin_story.isnot(None)
-    ).count()
-    
-    total_fun_facts = db.query(models.FunFact).count()
-    figures_with_facts = db.query(models.FunFact.figure_id).distinct().count()
+    figures = status.get_figure_status(db)
+    total = figures["total_figures"]
+    with_origin_story = figures["with_origin_stories"]
+    total_fun_facts = figures["total_fun_facts"]
     
     return {
         "total_figures": total,
         "with_origin_stories": with_origin_story,
         "without_origin_stories": total - with_origin_story,
-        "origin_story_percentage": round((with_origin_story / total * 100) if total > 0 else 0, 1),
+        "origin_story_percentage": status.percentage(with_origin_story, total),
         "total_fun_facts": total_fun_facts,
-        "figures_with_fun_facts": figures_with_facts,
+        "figures_with_fun_facts": figures["figures_with_fun_facts"],
         "avg_facts_per_figure": round(total_fun_facts / total if total > 0 else 0, 1)
     }
 
 
 @router.put("/update-origin-story/{figure_id}")
-async def update_origin_story(
+def update_origin_story(
     figure_id: int,
     request: UpdateOriginStoryRequest,
     db: Session = Depends(get_db)
@@ -301,7 +553,7 @@ async def update_origin_story(
 
 
 @router.put("/update-fun-fact/{fact_id}")
-async def update_fun_fact(
+def update_fun_fact(
     fact_id: int,
     request: UpdateFunFactRequest,
     db: Session = Depends(get_db)
@@ -335,7 +587,7 @@ async def update_fun_fact(
 
 
 @router.delete("/delete-origin-story/{figure_id}")
-async def delete_origin_story(
+def delete_origin_story(
     figure_id: int,
     db: Session = Depends(get_db)
 ):
@@ -360,7 +612,7 @@ async def delete_origin_story(
 
 
 @router.delete("/delete-fun-fact/{fact_id}")
-async def delete_fun_fact(
+def delete_fun_fact(
     fact_id: int,
     db: Session = Depends(get_db)
 ):
@@ -1,11 +1,41 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, noload, selectinload
 from app import models, schemas
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
+
+# Relations get_figure can load; "cognates" nests under etymologies
+FIGURE_INCLUDES = ("etymologies", "cognates", "fun_facts")
 
 
 # MythologicalFigure CRUD
-def get_figure(db: Session, figure_id: int) -> Optional[models.MythologicalFigure]:
-    return db.query(models.MythologicalFigure).filter(models.MythologicalFigure.id == figure_id).first()
+def _figure_load_options(include: Iterable[str]) -> list:
+    """Loader options that fetch each included relation in one extra query and skip the rest."""
+    include = set(include)
+    figure = models.MythologicalFigure
+    if "cognates" in include:
+        etymologies = selectinload(figure.etymologies).selectinload(models.Etymology.cognates)
+    elif "etymologies" in include:
+        etymologies = selectinload(figure.etymologies).noload(models.Etymology.cognates)
+    else:
+        etymologies = noload(figure.etymologies)
+    fun_facts = selectinload(figure.fun_facts) if "fun_facts" in include else noload(figure.fun_facts)
+    return [etymologies, fun_facts]
+
+
+def get_figure(
+    db: Session,
+    figure_id: int,
+    include: Optional[Iterable[str]] = None
+) -> Optional[models.MythologicalFigure]:
+    """
+    A figure by id. With `include` (names from FIGURE_INCLUDES) the listed
+    relations are eager-loaded and the others left empty, so serializing it
+    costs a fixed number of queries.
+    """
+    query = db.query(models.MythologicalFigure)
+    if include is not None:
+        query = query.options(*_figure_load_options(include))
+    return query.filter(models.MythologicalFigure.id == figure_id).first()
 
 
 def get_figure_by_name(db: Session, english_name: str) -> Optional[models.MythologicalFigure]:
@@ -99,6 +129,65 @@ def create_fun_fact(db: Session, fun_fact: schemas.FunFactCreate) -> models.FunF
     return db_fun_fact
 
 
+def get_fun_fact_counts(db: Session) -> Dict[int, int]:
+    """Fun fact count per figure id, in one grouped query."""
+    rows = db.query(
+        models.FunFact.figure_id, func.count(models.FunFact.id)
+    ).group_by(models.FunFact.figure_id).all()
+    return {figure_id: count for figure_id, count in rows}
+
+
+# Generated content
+def generated_fun_fact(figure_id: int, fact: dict) -> models.FunFact:
+    """FunFact row for a generated fact dict (content, category, surprise_factor)."""
+    return models.FunFact(
+        figure_id=figure_id,
+        content=fact.get('content', ''),
+        category=fact.get('category', 'mythological'),
+        surprise_factor=fact.get('surprise_factor', 3),
+        source_citation='Generated by AI based on classical sources'
+    )
+
+
+def save_generated_content(
+    db: Session,
+    stories: Dict[int, str],
+    facts: Dict[int, List[dict]],
+    skip_existing: bool = False
+) -> Dict[str, int]:
+    """
+    Write several figures' origin stories and fun facts in one commit.
+    With skip_existing, figures that already have a story (or any facts)
+    keep them, so replaying the same results never duplicates content.
+    """
+    stories_saved = 0
+    if stories:
+        for figure in db.query(models.MythologicalFigure).filter(
+            models.MythologicalFigure.id.in_(list(stories))
+        ).all():
+            if skip_existing and figure.origin_story:
+                continue
+            figure.origin_story = stories[figure.id]
+            stories_saved += 1
+    
+    if skip_existing and facts:
+        existing = set(
+            figure_id for (figure_id,) in db.query(models.FunFact.figure_id).filter(
+                models.FunFact.figure_id.in_(list(facts))
+            ).distinct()
+        )
+        facts = {figure_id: f for figure_id, f in facts.items() if figure_id not in existing}
+    rows = [generated_fun_fact(figure_id, fact) for figure_id, figure_facts in facts.items() for fact in figure_facts]
+    db.add_all(rows)
+    
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"origin_stories": stories_saved, "fun_facts": len(rows)}
+
+
 # Relationship helpers
 def link_figure_etymology(db: Session, figure_id: int, etymology_id: int):
     """Link a figure to an etymology."""
@@ -1,16 +1,148 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from app.config import get_database_url
 
-engine = create_engine(get_database_url())
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sync routes run on anyio's worker threads; size the pool so every worker
+# thread can hold a connection without waiting.
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(max(THREADPOOL_SIZE - DB_POOL_SIZE, 0))))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # SQL Server drops idle logins
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "0"))  # connections to open at boot
+
+# Checkout wait statistics, updated by TimedQueuePool
+pool_stats = {
+    "checkouts": 0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+    "timeouts": 0,
+    "connects": 0
+}
+_pool_stats_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with _pool_stats_lock:
+                pool_stats["timeouts"] += 1
+            raise
+        finally:
+            waited = (time.perf_counter() - start) * 1000
+            with _pool_stats_lock:
+                pool_stats["checkouts"] += 1
+                pool_stats["wait_ms_total"] += waited
+                pool_stats["wait_ms_max"] = max(pool_stats["wait_ms_max"], waited)
+
+
+# The engine is created on first use so importing the app does not block on
+# Secret Manager; SessionLocal is bound to it at that point.
+_engine = None
+_engine_lock = threading.Lock()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+
+def _count_connect(dbapi_connection, connection_record):
+    with _pool_stats_lock:
+        pool_stats["connects"] += 1
+
+
+def get_engine():
+    """Return the shared engine, creating it (and resolving the DB password) on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from sqlalchemy import event
+
+                engine = create_engine(
+                    get_database_url(),
+                    poolclass=TimedQueuePool,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=DB_POOL_PRE_PING
+                )
+                event.listen(engine, "connect", _count_connect)
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def __getattr__(name):
+    # Keep `from app.database import engine` working for scripts
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def prewarm_pool(count: int = DB_POOL_PREWARM) -> int:
+    """Open `count` connections in parallel and return them to the pool."""
+    count = min(count, DB_POOL_SIZE)
+    if count <= 0:
+        return 0
+    engine = get_engine()
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        connections = list(executor.map(lambda _: engine.raw_connection(), range(count)))
+    for connection in connections:
+        connection.close()
+    return len(connections)
+
+
+def get_pool_status() -> dict:
+    """Current pool occupancy plus checkout wait statistics."""
+    if _engine is None:
+        return {"initialized": False}
+    pool = _engine.pool
+    with _pool_stats_lock:
+        stats = dict(pool_stats)
+    return {
+        "initialized": True,
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": stats["checkouts"],
+        "connects": stats["connects"],
+        "timeouts": stats["timeouts"],
+        "avg_wait_ms": round(stats["wait_ms_total"] / stats["checkouts"], 2) if stats["checkouts"] else 0,
+        "max_wait_ms": round(stats["wait_ms_max"], 2)
+    }
+
+
 def get_db():
     """Dependency for FastAPI endpoints."""
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Run a blocking database call on a worker thread.
+
+    Async routes and background generators use this for every Session query
+    and commit so a slow SQL Server round trip never stalls the event loop.
+    A Session must still only be used by one call at a time.
+    """
+    from starlette.concurrency import run_in_threadpool
+    return await run_in_threadpool(func, *args, **kwargs)
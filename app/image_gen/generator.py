@@ -3,56 +3,65 @@ Etymython Figure Image Generation - Production Generator
 Generates Renaissance portrait images for mythological figures using DALL-E 3.
 """
 import os
+import json
 import asyncio
-import httpx
-from datetime import datetime
-from typing import Optional, Dict
-from google.cloud import storage
-from openai import AsyncOpenAI
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional, Dict, Iterable, Union
 from sqlalchemy.orm import Session
-from PIL import Image
-import io
+from typing import TYPE_CHECKING
+from contextlib import nullcontext
 
+from app import jobs, metrics, versioning
+from app.database import run_db
+from app.openai_client import get_shared_openai_client
+from app.storage import upload_batch, list_blobs, public_url, read_json, write_json, get_blob_metadata
+from app.imaging import create_derivatives, derivative_folder, spooled_download, THUMBNAIL_SIZE
+from app.rate_limit import TokenBucket, is_rate_limit_error, retry_after_seconds
 from .figure_prompts import FIGURE_PROMPTS, get_all_figure_names
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
 # GCS bucket configuration
 BUCKET_NAME = "etymython-media"
 FIGURE_FOLDER = "figure-images"
+CACHE_FOLDER = f"{FIGURE_FOLDER}/cache"  # prompt-hash manifests
 
-# Generation tracking (in-memory for now; could move to database)
-generation_status = {
-    "total": 0,
-    "completed": 0,
-    "failed": 0,
-    "current": None,
-    "errors": []
-}
+# DALL-E request settings (part of the generation cache key)
+DALLE_MODEL = "dall-e-3"
+DALLE_SIZE = "1024x1024"
+DALLE_QUALITY = "standard"
 
-def get_openai_client():
-    """Get AsyncOpenAI client with API key from environment or Secret Manager."""
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        try:
-            from google.cloud import secretmanager
-            client = secretmanager.SecretManagerServiceClient()
-            name = "projects/etymython-project/secrets/openai-api-key/versions/latest"
-            response = client.access_secret_version(request={"name": name})
-            api_key = response.payload.data.decode("UTF-8").strip()
-        except Exception as e:
-            raise ValueError(f"Could not get OpenAI API key: {e}")
-    
-    if not api_key:
-        raise ValueError("OpenAI API key is empty")
-    
-    return AsyncOpenAI(api_key=api_key, timeout=60.0)
+# Batch settings
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+DALLE_IMAGES_PER_MINUTE = float(os.getenv("DALLE_IMAGES_PER_MINUTE", "15"))
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("DALLE_MAX_RATE_LIMIT_RETRIES", "5"))
 
-def get_gcs_client():
-    """Get GCS client."""
-    return storage.Client()
+# Batch progress lives in the batch_jobs tables (see app.jobs); only the
+# rate limiter of a batch running in this process is kept here.
+JOB_KIND = "images"
+_batch_rate_limiter: Optional[TokenBucket] = None
+
+def get_openai_client() -> "AsyncOpenAI":
+    """Get the shared AsyncOpenAI client with a 60s timeout for image requests."""
+    try:
+        client = get_shared_openai_client()
+    except Exception as e:
+        raise ValueError(f"Could not get OpenAI API key: {e}")
+    
+    return client.with_options(timeout=60.0)
 
-async def generate_figure_image(figure_name: str, retry_count: int = 0, max_retries: int = 2) -> Dict:
+async def generate_figure_image(
+    figure_name: str,
+    retry_count: int = 0,
+    max_retries: int = 2,
+    rate_limiter: Optional[TokenBucket] = None,
+    throttle_count: int = 0
+) -> Dict:
     """
     Generate a single figure image using DALL-E 3 with automatic retry and prompt sanitization.
+    When a rate limiter is given, each request waits for a token and 429s back off through it.
     Returns dict with success status and image URL.
     """
     if figure_name not in FIGURE_PROMPTS:
@@ -84,17 +93,25 @@ async def generate_figure_image(figure_name: str, retry_count: int = 0, max_retr
         prompt_text = sanitized
     
     try:
-        response = await client.images.generate(
-            model="dall-e-3",
-            prompt=prompt_text,
-            size="1024x1024",
-            quality="standard",
-            n=1,
-        )
+        if rate_limiter:
+            await rate_limiter.acquire()
+        
+        with metrics.track("openai", "images.generate", f"{DALLE_MODEL}:{DALLE_QUALITY}") as usage:
+            response = await client.images.generate(
+                model=DALLE_MODEL,
+                prompt=prompt_text,
+                size=DALLE_SIZE,
+                quality=DALLE_QUALITY,
+                n=1,
+            )
+            usage["images"] = len(response.data)
         
         image_url = response.data[0].url
         revised_prompt = response.data[0].revised_prompt
         
+        if rate_limiter:
+            rate_limiter.record_success()
+        
         return {
             "figure_name": figure_name,
             "success": True,
@@ -106,11 +123,21 @@ async def generate_figure_image(figure_name: str, retry_count: int = 0, max_retr
     except Exception as e:
         error_str = str(e)
         
+        # Rate limited: slow the shared bucket down and try the same prompt again
+        if is_rate_limit_error(e) and throttle_count < MAX_RATE_LIMIT_RETRIES:
+            if rate_limiter:
+                pause = rate_limiter.record_throttle(retry_after_seconds(e))
+            else:
+                pause = retry_after_seconds(e) or 2 ** (throttle_count + 1)
+                await asyncio.sleep(pause)
+            print(f"Rate limited on {figure_name}, backing off {pause:.1f}s (attempt {throttle_count + 1}/{MAX_RATE_LIMIT_RETRIES})")
+            return await generate_figure_image(figure_name, retry_count, max_retries, rate_limiter, throttle_count + 1)
+        
         # Check if it's a content policy violation and we can retry
         if "content_policy_violation" in error_str and retry_count < max_retries:
             print(f"Safety filter triggered for {figure_name}, retrying with sanitized prompt (attempt {retry_count + 1}/{max_retries})")
             await asyncio.sleep(1)  # Brief delay before retry
-            return await generate_figure_image(figure_name, retry_count + 1, max_retries)
+            return await generate_figure_image(figure_name, retry_count + 1, max_retries, rate_limiter, throttle_count)
         
         return {
             "figure_name": figure_name,
@@ -121,98 +148,167 @@ async def generate_figure_image(figure_name: str, retry_count: int = 0, max_retr
             "retry_count": retry_count
         }
 
-async def download_and_create_thumbnails(image_url: str, figure_name: str) -> Dict:
+def generation_cache_key(
+    prompt: str,
+    model: str = DALLE_MODEL,
+    size: str = DALLE_SIZE,
+    quality: str = DALLE_QUALITY
+) -> str:
+    """Content address of a generation: model, size, quality and whitespace-normalized prompt."""
+    normalized = " ".join(prompt.split())
+    payload = json.dumps([model, size, quality, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _load_cached_generation(cache_key: str) -> Optional[Dict]:
+    """Return the manifest for a cache key if its full image still holds that generation."""
+    entry = read_json(f"{CACHE_FOLDER}/{cache_key}.json", bucket_name=BUCKET_NAME)
+    if not entry:
+        return None
+    # The figure's object path is reused across prompts; make sure it was not overwritten
+    metadata = get_blob_metadata(entry["full_path"], bucket_name=BUCKET_NAME)
+    if metadata is None or metadata.get("prompt_hash") != cache_key:
+        return None
+    return entry
+
+async def get_cached_generation(figure_name: str) -> Optional[Dict]:
+    """Look up a stored image generated from the figure's current prompt."""
+    if figure_name not in FIGURE_PROMPTS:
+        return None
+    cache_key = generation_cache_key(FIGURE_PROMPTS[figure_name]["prompt"])
+    return await asyncio.to_thread(_load_cached_generation, cache_key)
+
+async def download_and_create_thumbnails(
+    image_url: str,
+    figure_name: str,
+    metadata: Optional[Dict] = None
+) -> Dict:
     """
     Download image from DALL-E and create both full and thumbnail versions.
-    Upload to GCS and return public URLs.
+    Upload to GCS and return public URLs. `metadata` is stored on the full image.
     """
-    gcs_client = get_gcs_client()
-    bucket = gcs_client.bucket(BUCKET_NAME)
-    
     # Use figure name as filename (normalized)
     filename = figure_name.lower().replace(" ", "_") + ".png"
     
-    # Download original image
-    async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(image_url)
-        image_data = response.content
-    
-    # Upload full-size image (1024x1024)
-    full_path = f"{FIGURE_FOLDER}/full/{filename}"
-    blob = bucket.blob(full_path)
-    blob.upload_from_string(image_data, content_type="image/png")
-    blob.make_public()
-    
-    # Create thumbnail (80x80)
-    img = Image.open(io.BytesIO(image_data))
-    
-    # Center crop to square (already square from DALL-E but being safe)
-    width, height = img.size
-    min_dim = min(width, height)
-    left = (width - min_dim) // 2
-    top = (height - min_dim) // 2
-    img_cropped = img.crop((left, top, left + min_dim, top + min_dim))
+    # Stream the image to a temp file; upload and thumbnail from that file
+    async with spooled_download(image_url) as image_path:
+        # Create 80/160/320 derivatives from one decode, off the event loop
+        derivatives = await create_derivatives(image_path)
+        
+        # Full-size image (1024x1024) plus every derivative, uploaded as one concurrent batch
+        full_path = f"{FIGURE_FOLDER}/full/{filename}"
+        sizes = sorted(derivatives)
+        items = [{"path": full_path, "filename": image_path, "content_type": "image/png", "metadata": metadata}] + [
+            {
+                "path": f"{FIGURE_FOLDER}/{derivative_folder(size)}/{filename}",
+                "data": derivatives[size],
+                "content_type": "image/png"
+            }
+            for size in sizes
+        ]
+        blob, *derivative_blobs = await upload_batch(items, bucket_name=BUCKET_NAME)
     
-    # Resize to 80x80 thumbnail
-    img_thumb = img_cropped.resize((80, 80), Image.Resampling.LANCZOS)
+    # /for-frontend lists GCS, not figure rows, so new files need their own version bump
+    try:
+        await run_db(versioning.bump)
+    except Exception as e:
+        print(f"Dataset version bump failed after uploading {filename}: {e}")
     
-    # Save thumbnail
-    thumb_buffer = io.BytesIO()
-    img_thumb.save(thumb_buffer, format="PNG")
-    thumb_data = thumb_buffer.getvalue()
+    urls = {size: b.public_url for size, b in zip(sizes, derivative_blobs)}
     
     thumb_path = f"{FIGURE_FOLDER}/thumbs/{filename}"
-    thumb_blob = bucket.blob(thumb_path)
-    thumb_blob.upload_from_string(thumb_data, content_type="image/png")
-    thumb_blob.make_public()
     
     return {
         "full_url": blob.public_url,
-        "thumb_url": thumb_blob.public_url,
+        "thumb_url": urls[THUMBNAIL_SIZE],
         "full_path": full_path,
-        "thumb_path": thumb_path
+        "thumb_path": thumb_path,
+        "derivative_urls": urls
     }
 
-async def generate_and_store_figure(figure_name: str, db: Session = None) -> Dict:
+def _update_figure_image_url(db: Session, figure_name: str, image_url: str):
+    """Point the figure at its new image (blocking; call through run_db)."""
+    from app import models
+    figure = db.query(models.MythologicalFigure).filter(
+        models.MythologicalFigure.english_name == figure_name
+    ).first()
+    
+    if figure:
+        figure.image_url = image_url  # Use thumbnail for family tree
+        db.commit()
+
+async def generate_and_store_figure(
+    figure_name: str,
+    db: Session = None,
+    rate_limiter: Optional[TokenBucket] = None,
+    db_lock: Optional[asyncio.Lock] = None,
+    force: bool = False
+) -> Dict:
     """
     Complete pipeline: generate image, download, create thumbnails, upload to GCS.
-    Optionally update database with image URLs.
+    Optionally update database with image URLs. Pass db_lock when several
+    figures share one Session concurrently.
+    
+    If the stored image was generated from the current prompt (same model,
+    size and quality) it is reused without calling DALL-E, unless force=True.
     """
     try:
-        # Update status
-        generation_status["current"] = figure_name
+        if not force:
+            cached = await get_cached_generation(figure_name)
+            if cached:
+                if db:
+                    async with db_lock or nullcontext():
+                        await run_db(_update_figure_image_url, db, figure_name, cached["thumb_url"])
+                return {
+                    "figure_name": figure_name,
+                    "figure_type": FIGURE_PROMPTS[figure_name]["figure_type"],
+                    "success": True,
+                    "cached": True,
+                    "full_url": cached["full_url"],
+                    "thumb_url": cached["thumb_url"],
+                    "dalle_url": None,
+                    "revised_prompt": cached.get("revised_prompt"),
+                    "error": None
+                }
         
         # Generate with DALL-E
-        result = await generate_figure_image(figure_name)
+        result = await generate_figure_image(figure_name, rate_limiter=rate_limiter)
         
         if not result["success"]:
-            generation_status["failed"] += 1
-            generation_status["errors"].append({
-                "figure": figure_name,
-                "error": result["error"]
-            })
             return result
         
-        # Download and upload to GCS
-        gcs_result = await download_and_create_thumbnails(result["image_url"], figure_name)
+        # Download and upload to GCS, tagging the full image with its prompt hash
+        cache_key = generation_cache_key(FIGURE_PROMPTS[figure_name]["prompt"])
+        gcs_result = await download_and_create_thumbnails(
+            result["image_url"], figure_name, metadata={"prompt_hash": cache_key}
+        )
+        
+        # Record the generation so an unchanged prompt is not billed again
+        await asyncio.to_thread(write_json, f"{CACHE_FOLDER}/{cache_key}.json", {
+            "cache_key": cache_key,
+            "figure_name": figure_name,
+            "model": DALLE_MODEL,
+            "size": DALLE_SIZE,
+            "quality": DALLE_QUALITY,
+            "prompt": FIGURE_PROMPTS[figure_name]["prompt"],
+            "revised_prompt": result["revised_prompt"],
+            "full_path": gcs_result["full_path"],
+            "thumb_path": gcs_result["thumb_path"],
+            "full_url": gcs_result["full_url"],
+            "thumb_url": gcs_result["thumb_url"],
+            "derivative_urls": gcs_result["derivative_urls"],
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, bucket_name=BUCKET_NAME)
         
         # Update database if session provided
         if db:
-            from app import models
-            figure = db.query(models.MythologicalFigure).filter(
-                models.MythologicalFigure.english_name == figure_name
-            ).first()
-            
-            if figure:
-                figure.image_url = gcs_result["thumb_url"]  # Use thumbnail for family tree
-                db.commit()
-        
-        generation_status["completed"] += 1
+            async with db_lock or nullcontext():
+                await run_db(_update_figure_image_url, db, figure_name, gcs_result["thumb_url"])
         
         return {
             "figure_name": figure_name,
             "figure_type": FIGURE_PROMPTS[figure_name]["figure_type"],
             "success": True,
+            "cached": False,
             "full_url": gcs_result["full_url"],
             "thumb_url": gcs_result["thumb_url"],
             "dalle_url": result["image_url"],
@@ -220,51 +316,79 @@ async def generate_and_store_figure(figure_name: str, db: Session = None) -> Dic
             "error": None
         }
     except Exception as e:
-        generation_status["failed"] += 1
-        generation_status["errors"].append({
-            "figure": figure_name,
-            "error": str(e)
-        })
         return {
             "figure_name": figure_name,
             "success": False,
             "error": f"Pipeline failed: {type(e).__name__}: {str(e)}"
         }
 
-async def generate_all_figures(db: Session = None, delay_seconds: float = 2.0) -> list[Dict]:
+async def generate_all_figures(
+    db: Session = None,
+    concurrency: int = IMAGE_BATCH_CONCURRENCY,
+    images_per_minute: float = DALLE_IMAGES_PER_MINUTE,
+    force: Union[bool, Iterable[str]] = False,
+    job: Optional[Dict] = None
+) -> list[Dict]:
     """
-    Generate images for all figures with delay between requests.
-    Returns list of results for each figure.
+    Generate images for all figures, up to `concurrency` at a time.
+    Requests are paced by a token bucket at `images_per_minute` that backs off on 429s.
+    Figures whose prompt is unchanged reuse their stored image; `force` is
+    True to regenerate everything or a collection of figure names to regenerate.
+    
+    Progress is checkpointed per figure in a batch job (`job` from
+    jobs.start_or_resume_job, created here if not given), so an interrupted
+    batch resumes with the figures it had not finished. Cancelling the job
+    stops it before the next figure.
+    Returns list of results for the figures processed, in catalog order.
     """
+    global _batch_rate_limiter
+    
     figure_names = get_all_figure_names()
+    if job is None:
+        job = await run_db(jobs.start_or_resume_job, JOB_KIND, figure_names)
+    job_id = job["job_id"]
+    pending = job["pending"]
     
-    # Initialize status
-    generation_status["total"] = len(figure_names)
-    generation_status["completed"] = 0
-    generation_status["failed"] = 0
-    generation_status["current"] = None
-    generation_status["errors"] = []
+    rate_limiter = TokenBucket(images_per_minute)
+    _batch_rate_limiter = rate_limiter
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    db_lock = asyncio.Lock()
+    forced = set(figure_names) if force is True else set(force or ())
     
-    results = []
-    for i, figure_name in enumerate(figure_names):
-        print(f"Generating {i+1}/{len(figure_names)}: {figure_name}")
-        result = await generate_and_store_figure(figure_name, db)
-        results.append(result)
-        
-        # Delay between requests to avoid rate limits
-        if i < len(figure_names) - 1:
-            await asyncio.sleep(delay_seconds)
+    async def run_one(i: int, figure_name: str) -> Dict:
+        async with semaphore:
+            # A reset cancels the job; figures still queued are left pending
+            if await run_db(jobs.is_cancelled, job_id):
+                return {"figure_name": figure_name, "success": False, "error": "Job cancelled"}
+            print(f"Generating {i+1}/{len(pending)}: {figure_name}")
+            await run_db(jobs.mark_item_running, job_id, figure_name)
+            result = await generate_and_store_figure(
+                figure_name, db, rate_limiter, db_lock, force=figure_name in forced
+            )
+            if result["success"]:
+                await run_db(jobs.mark_item_succeeded, job_id, figure_name, {
+                    "cached": result.get("cached", False),
+                    "full_url": result.get("full_url"),
+                    "thumb_url": result.get("thumb_url"),
+                    "revised_prompt": result.get("revised_prompt")
+                })
+            else:
+                await run_db(jobs.mark_item_failed, job_id, figure_name, result.get("error") or "unknown error")
+            return result
     
-    generation_status["current"] = None
-    return results
+    try:
+        results = await asyncio.gather(
+            *(run_one(i, name) for i, name in enumerate(pending))
+        )
+        await run_db(jobs.finish_job, job_id)
+    finally:
+        _batch_rate_limiter = None
+    return list(results)
 
 def list_generated_figures() -> list[Dict]:
     """List all generated figure images from GCS."""
-    gcs_client = get_gcs_client()
-    bucket = gcs_client.bucket(BUCKET_NAME)
-    
     images = []
-    blobs = bucket.list_blobs(prefix=f"{FIGURE_FOLDER}/full/")
+    blobs = list_blobs(f"{FIGURE_FOLDER}/full/", bucket_name=BUCKET_NAME)
     
     for blob in blobs:
         if not blob.name.endswith('.png'):
@@ -282,28 +406,47 @@ def list_generated_figures() -> list[Dict]:
             "figure_name": figure_name,
             "figure_type": prompt_data.get("figure_type", "Unknown"),
             "full_url": blob.public_url,
-            "thumb_url": f"https://storage.googleapis.com/{BUCKET_NAME}/{thumb_path}",
+            "thumb_url": public_url(thumb_path, bucket_name=BUCKET_NAME),
             "created_at": blob.time_created.isoformat() if blob.time_created else None
         })
     
     return images
 
 def get_generation_status() -> Dict:
-    """Get current generation status."""
+    """Get status of the latest image batch from the job store (blocking)."""
+    status = jobs.get_job_status(JOB_KIND)
+    if status is None:
+        return {
+            "job_id": None,
+            "status": None,
+            "total": 0,
+            "completed": 0,
+            "cached": 0,
+            "failed": 0,
+            "current": None,
+            "in_flight": [],
+            "in_progress": False,
+            "progress_percent": 0,
+            "errors": [],
+            "rate_limit": None
+        }
+    
+    in_flight = status["in_flight"]
     return {
-        "total": generation_status["total"],
-        "completed": generation_status["completed"],
-        "failed": generation_status["failed"],
-        "current": generation_status["current"],
-        "in_progress": generation_status["current"] is not None,
-        "progress_percent": round((generation_status["completed"] / generation_status["total"] * 100), 1) if generation_status["total"] > 0 else 0,
-        "errors": generation_status["errors"]
+        "job_id": status["job_id"],
+        "status": status["status"],
+        "total": status["total"],
+        "completed": status["succeeded"],
+        "cached": sum(1 for r in status["results"].values() if r.get("cached")),
+        "failed": status["failed"],
+        "current": in_flight[-1] if in_flight else None,
+        "in_flight": in_flight,
+        "in_progress": status["in_progress"],
+        "progress_percent": round((status["succeeded"] / status["total"] * 100), 1) if status["total"] > 0 else 0,
+        "errors": [{"figure": e["item"], "error": e["error"], "attempts": e["attempts"]} for e in status["errors"]],
+        "rate_limit": _batch_rate_limiter.snapshot() if _batch_rate_limiter else None
     }
 
 def reset_generation_status():
-    """Reset generation status tracking."""
-    generation_status["total"] = 0
-    generation_status["completed"] = 0
-    generation_status["failed"] = 0
-    generation_status["current"] = None
-    generation_status["errors"] = []
+    """Cancel the running image batch so it is not resumed (blocking)."""
+    return jobs.cancel_active_job(JOB_KIND)
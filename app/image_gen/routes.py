@@ -2,14 +2,23 @@
 Etymython Figure Image Generation - API Routes
 Endpoints for generating and retrieving figure images.
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 import asyncio
 
-from app.database import get_db
+from app.database import get_db, run_db
+from app.jobs import JobInProgress, start_or_resume_job
+from app.metrics import image_price
+from app.status import get_figure_status, percentage
+from app.versioning import conditional_get
 from .generator import (
+    JOB_KIND,
+    IMAGE_BATCH_CONCURRENCY,
+    DALLE_IMAGES_PER_MINUTE,
+    DALLE_MODEL,
+    DALLE_QUALITY,
     generate_and_store_figure,
     generate_all_figures,
     list_generated_figures,
@@ -23,18 +32,24 @@ router = APIRouter(prefix="/api/v1/images", tags=["Figure Images"])
 class GenerationResult(BaseModel):
     figure_name: str
     success: bool
+    cached: bool = False
     full_url: Optional[str] = None
     thumb_url: Optional[str] = None
     error: Optional[str] = None
 
 class GenerationStatus(BaseModel):
+    job_id: Optional[int] = None
+    status: Optional[str] = None
     total: int
     completed: int
+    cached: int = 0
     failed: int
     current: Optional[str]
+    in_flight: List[str] = []
     in_progress: bool
     progress_percent: float
     errors: List[dict]
+    rate_limit: Optional[dict] = None
 
 class FigureImage(BaseModel):
     figure_name: str
@@ -62,11 +77,14 @@ async def get_generated_images() -> List[FigureImage]:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/for-frontend")
-async def get_images_for_frontend() -> dict:
+async def get_images_for_frontend(request: Request, response: Response):
     """
     Get images formatted for frontend Cytoscape integration.
     Returns a mapping of figure names to thumbnail URLs.
+    Every image upload bumps the dataset version, so the ETag tracks the listing.
     """
+    if not_modified := await run_db(conditional_get, request, response):
+        return not_modified
     try:
         images = list_generated_figures()
         return {
@@ -79,9 +97,13 @@ async def get_images_for_frontend() -> dict:
 @router.post("/generate/{figure_name}")
 async def generate_single_figure(
     figure_name: str,
+    force: bool = False,
     db: Session = Depends(get_db)
 ) -> GenerationResult:
-    """Generate image for a single figure."""
+    """
+    Generate image for a single figure.
+    Reuses the stored image if the prompt is unchanged; pass force=true to regenerate.
+    """
     if figure_name not in get_all_figure_names():
         raise HTTPException(
             status_code=404,
@@ -89,11 +111,12 @@ async def generate_single_figure(
         )
     
     try:
-        result = await generate_and_store_figure(figure_name, db)
+        result = await generate_and_store_figure(figure_name, db, force=force)
         
         return GenerationResult(
             figure_name=result["figure_name"],
             success=result["success"],
+            cached=result.get("cached", False),
             full_url=result.get("full_url"),
             thumb_url=result.get("thumb_url"),
             error=result.get("error")
@@ -105,59 +128,72 @@ async def generate_single_figure(
             error=str(e)
         )
 
-async def run_batch_generation(db: Session):
+async def run_batch_generation(db: Session, force=False, job: Optional[dict] = None):
     """Background task to generate all figures."""
     try:
-        await generate_all_figures(db=db, delay_seconds=2.0)
+        await generate_all_figures(db=db, force=force, job=job)
     except Exception as e:
         print(f"Batch generation error: {e}")
 
 @router.post("/generate-all")
 async def start_batch_generation(
     background_tasks: BackgroundTasks,
+    force_all: bool = False,
+    force: List[str] = Query(default=[]),
     db: Session = Depends(get_db)
 ) -> dict:
     """
     Start batch generation of all figure images in background.
+    Figures with an unchanged prompt reuse their stored image; pass
+    force=<name> (repeatable) or force_all=true to regenerate.
+    An interrupted batch is resumed with the figures it had not finished.
     Returns immediately with status endpoint.
     """
-    status = get_generation_status()
-    if status["in_progress"]:
+    try:
+        job = await run_db(
+            start_or_resume_job,
+            JOB_KIND,
+            get_all_figure_names(),
+            {"force_all": force_all, "force": force}
+        )
+    except JobInProgress:
         return {
             "message": "Generation already in progress",
-            "status": status
+            "status": await run_db(get_generation_status)
         }
     
-    # Reset status and start background task
-    reset_generation_status()
-    background_tasks.add_task(run_batch_generation, db)
+    background_tasks.add_task(run_batch_generation, db, True if force_all else force, job)
     
-    figure_count = len(get_all_figure_names())
-    estimated_cost = figure_count * 0.04  # $0.04 per image
+    figure_count = len(job["pending"])
+    estimated_cost = figure_count * image_price(DALLE_MODEL, DALLE_QUALITY)
     
     return {
-        "message": f"Started batch generation of {figure_count} figures",
-        "estimated_cost": f"${estimated_cost:.2f}",
-        "estimated_time": f"{figure_count * 3 / 60:.1f} minutes",
+        "message": f"{'Resumed' if job['resumed'] else 'Started'} batch generation of {figure_count} figures",
+        "job_id": job["job_id"],
+        "resumed": job["resumed"],
+        "estimated_cost": f"up to ${estimated_cost:.2f} (unchanged prompts are reused)",
+        "estimated_time": f"{figure_count / DALLE_IMAGES_PER_MINUTE:.1f} minutes",
+        "concurrency": IMAGE_BATCH_CONCURRENCY,
         "status_endpoint": "/api/v1/images/generate-status"
     }
 
 @router.get("/generate-status")
-async def check_generation_status() -> GenerationStatus:
-    """Check the status of ongoing batch generation."""
+def check_generation_status() -> GenerationStatus:
+    """Check the status of the latest batch generation (shared across workers)."""
     status = get_generation_status()
     return GenerationStatus(**status)
 
 @router.post("/reset-status")
-async def reset_status() -> dict:
-    """Reset generation status (admin endpoint)."""
-    reset_generation_status()
-    return {"message": "Status reset successfully"}
+def reset_status() -> dict:
+    """Cancel the running batch job so it is not resumed (admin endpoint)."""
+    job_id = reset_generation_status()
+    return {"message": "Status reset successfully", "cancelled_job_id": job_id}
 
 @router.get("/stats")
-async def get_image_stats() -> dict:
+async def get_image_stats(db: Session = Depends(get_db)) -> dict:
     """Get statistics about generated images."""
     images = list_generated_figures()
+    figures = await run_db(get_figure_status, db)
     
     # Group by figure type
     by_type = {}
@@ -169,13 +205,16 @@ async def get_image_stats() -> dict:
     
     total_available = len(get_all_figure_names())
     total_generated = len(images)
+    price = image_price(DALLE_MODEL, DALLE_QUALITY)
     
     return {
         "total_available": total_available,
         "total_generated": total_generated,
         "remaining": total_available - total_generated,
-        "progress_percent": round((total_generated / total_available * 100), 1) if total_available > 0 else 0,
+        "progress_percent": percentage(total_generated, total_available),
         "by_type": by_type,
-        "estimated_cost_remaining": f"${(total_available - total_generated) * 0.04:.2f}",
-        "total_cost_if_all": f"${total_available * 0.04:.2f}"
+        "figures_with_image_url": figures["with_images"],
+        "figures_total": figures["total_figures"],
+        "estimated_cost_remaining": f"${(total_available - total_generated) * price:.2f}",
+        "total_cost_if_all": f"${total_available * price:.2f}"
     }
@@ -2,41 +2,31 @@
 Etymython Image Style Test - DALL-E 3 Generator
 Generates images from prompts and stores in GCS.
 """
-import os
 import asyncio
-import httpx
 from datetime import datetime
-from typing import Optional
-from google.cloud import storage
-from openai import AsyncOpenAI
+from typing import Optional, TYPE_CHECKING
+
+from app import metrics
+from app.openai_client import get_shared_openai_client
+from app.storage import upload_batch, list_blobs, public_url
+from app.imaging import create_derivatives, derivative_folder, spooled_download, THUMBNAIL_SIZE
 from .prompts import PROMPTS, get_all_prompt_ids
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
 # GCS bucket for images
 BUCKET_NAME = "etymython-media"
 TEST_FOLDER = "style-test"
 
-def get_openai_client():
-    """Get AsyncOpenAI client with API key from environment or Secret Manager."""
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        # Try to get from Secret Manager
-        try:
-            from google.cloud import secretmanager
-            client = secretmanager.SecretManagerServiceClient()
-            name = "projects/etymython-project/secrets/openai-api-key/versions/latest"
-            response = client.access_secret_version(request={"name": name})
-            api_key = response.payload.data.decode("UTF-8").strip()
-        except Exception as e:
-            raise ValueError(f"Could not get OpenAI API key: {e}")
-    
-    if not api_key:
-        raise ValueError("OpenAI API key is empty")
+def get_openai_client() -> "AsyncOpenAI":
+    """Get the shared AsyncOpenAI client with a 60s timeout for image requests."""
+    try:
+        client = get_shared_openai_client()
+    except Exception as e:
+        raise ValueError(f"Could not get OpenAI API key: {e}")
     
-    return AsyncOpenAI(api_key=api_key, timeout=60.0)
-
-def get_gcs_client():
-    """Get GCS client."""
-    return storage.Client()
+    return client.with_options(timeout=60.0)
 
 async def generate_single_image(prompt_id: str, prompt_text: str) -> dict:
     """
@@ -46,13 +36,15 @@ async def generate_single_image(prompt_id: str, prompt_text: str) -> dict:
     client = get_openai_client()
     
     try:
-        response = await client.images.generate(
-            model="dall-e-3",
-            prompt=prompt_text,
-            size="1024x1024",
-            quality="standard",  # or "hd" for higher quality ($0.08 vs $0.04)
-            n=1,
-        )
+        with metrics.track("openai", "images.generate", "dall-e-3:standard") as usage:
+            response = await client.images.generate(
+                model="dall-e-3",
+                prompt=prompt_text,
+                size="1024x1024",
+                quality="standard",  # or "hd" for higher quality ($0.08 vs $0.04)
+                n=1,
+            )
+            usage["images"] = len(response.data)
         
         image_url = response.data[0].url
         revised_prompt = response.data[0].revised_prompt
@@ -78,56 +70,37 @@ async def download_and_upload_to_gcs(image_url: str, prompt_id: str) -> dict:
     Download image from DALL-E URL and upload to GCS.
     Returns GCS paths for full image and thumbnail.
     """
-    gcs_client = get_gcs_client()
-    bucket = gcs_client.bucket(BUCKET_NAME)
-    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{prompt_id}_{timestamp}.png"
     
-    # Download image
-    async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(image_url)
-        image_data = response.content
-    
-    # Upload full-size image
-    full_path = f"{TEST_FOLDER}/full/{filename}"
-    blob = bucket.blob(full_path)
-    blob.upload_from_string(image_data, content_type="image/png")
-    
-    # Generate thumbnail (80x80) using PIL
-    from PIL import Image
-    import io
-    
-    img = Image.open(io.BytesIO(image_data))
-    
-    # Create square crop from center
-    width, height = img.size
-    min_dim = min(width, height)
-    left = (width - min_dim) // 2
-    top = (height - min_dim) // 2
-    img_cropped = img.crop((left, top, left + min_dim, top + min_dim))
-    
-    # Resize to 80x80
-    img_thumb = img_cropped.resize((80, 80), Image.Resampling.LANCZOS)
-    
-    # Save thumbnail
-    thumb_buffer = io.BytesIO()
-    img_thumb.save(thumb_buffer, format="PNG")
-    thumb_data = thumb_buffer.getvalue()
+    # Stream the image to a temp file; upload and thumbnail from that file
+    async with spooled_download(image_url) as image_path:
+        # Create 80/160/320 derivatives from one decode, off the event loop
+        derivatives = await create_derivatives(image_path)
+        
+        # Full-size image plus every derivative, uploaded as one concurrent batch
+        full_path = f"{TEST_FOLDER}/full/{filename}"
+        sizes = sorted(derivatives)
+        items = [{"path": full_path, "filename": image_path, "content_type": "image/png"}] + [
+            {
+                "path": f"{TEST_FOLDER}/{derivative_folder(size)}/{filename}",
+                "data": derivatives[size],
+                "content_type": "image/png"
+            }
+            for size in sizes
+        ]
+        blob, *derivative_blobs = await upload_batch(items, bucket_name=BUCKET_NAME)
+    
+    urls = {size: b.public_url for size, b in zip(sizes, derivative_blobs)}
     
     thumb_path = f"{TEST_FOLDER}/thumbs/{filename}"
-    thumb_blob = bucket.blob(thumb_path)
-    thumb_blob.upload_from_string(thumb_data, content_type="image/png")
-    
-    # Make both publicly accessible
-    blob.make_public()
-    thumb_blob.make_public()
     
     return {
         "full_url": blob.public_url,
-        "thumb_url": thumb_blob.public_url,
+        "thumb_url": urls[THUMBNAIL_SIZE],
         "full_path": full_path,
-        "thumb_path": thumb_path
+        "thumb_path": thumb_path,
+        "derivative_urls": urls
     }
 
 async def generate_and_store_image(prompt_id: str) -> dict:
@@ -197,18 +170,14 @@ def generate_category_sync(category: str, delay_seconds: float = 2.0) -> list[di
 # List existing test images in GCS
 def list_test_images() -> list[dict]:
     """List all generated test images from GCS."""
-    gcs_client = get_gcs_client()
-    bucket = gcs_client.bucket(BUCKET_NAME)
-    
     images = []
-    blobs = bucket.list_blobs(prefix=f"{TEST_FOLDER}/full/")
+    blobs = list_blobs(f"{TEST_FOLDER}/full/", bucket_name=BUCKET_NAME)
     
     for blob in blobs:
         filename = blob.name.split("/")[-1]
         prompt_id = "_".join(filename.split("_")[:-2])  # Remove timestamp
         
         thumb_path = f"{TEST_FOLDER}/thumbs/{filename}"
-        thumb_blob = bucket.blob(thumb_path)
         
         if prompt_id in PROMPTS:
             images.append({
@@ -217,7 +186,7 @@ def list_test_images() -> list[dict]:
                 "style": PROMPTS[prompt_id]["style"],
                 "prompt": PROMPTS[prompt_id]["prompt"],
                 "full_url": blob.public_url,
-                "thumb_url": f"https://storage.googleapis.com/{BUCKET_NAME}/{thumb_path}",
+                "thumb_url": public_url(thumb_path, bucket_name=BUCKET_NAME),
                 "created_at": blob.time_created.isoformat() if blob.time_created else None
             })
     
@@ -7,6 +7,7 @@ from pydantic import BaseModel
 import asyncio
 import os
 
+from app.metrics import image_price
 from .prompts import PROMPTS, get_all_prompt_ids, get_categories
 from .generator import generate_and_store_image, list_test_images
 
@@ -122,7 +123,7 @@ async def generate_category(category: str, background_tasks: BackgroundTasks) ->
     return {
         "message": f"Queued {len(prompt_ids)} images for generation",
         "prompt_ids": prompt_ids,
-        "estimated_cost": f"${len(prompt_ids) * 0.04:.2f}"
+        "estimated_cost": f"${len(prompt_ids) * image_price('dall-e-3'):.2f}"
     }
 
 @router.get("/stats")
@@ -142,5 +143,5 @@ async def get_stats() -> dict:
             }
             for cat in get_categories()
         },
-        "estimated_cost_remaining": f"${(len(PROMPTS) - len(images)) * 0.04:.2f}"
+        "estimated_cost_remaining": f"${(len(PROMPTS) - len(images)) * image_price('dall-e-3'):.2f}"
     }
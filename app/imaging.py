@@ -0,0 +1,115 @@
+"""
+Image download and derivative rendering.
+Downloads stream to a temp file in fixed-size chunks; decode, crop, resize
+and encode run in a bounded process pool so PIL work never blocks the event
+loop. One decode produces every configured size.
+"""
+import os
+import asyncio
+import tempfile
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, Optional, Union
+
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+THUMBNAIL_SIZE = 80  # used by the frontend graph; stored under thumbs/
+THUMBNAIL_SIZES = sorted({THUMBNAIL_SIZE} | {
+    int(size) for size in os.getenv("THUMBNAIL_SIZES", "80,160,320").split(",") if size.strip()
+})
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("IMAGE_DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+IMAGE_TMP_DIR = os.getenv("IMAGE_TMP_DIR") or None  # defaults to the system temp dir
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def derivative_folder(size: int) -> str:
+    """Folder name for a derivative size (80px keeps the original thumbs/ path)."""
+    return "thumbs" if size == THUMBNAIL_SIZE else f"thumbs-{size}"
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        # spawn: forking a process that already runs threads is not safe
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_process_pool():
+    """Stop the worker processes. Called on app shutdown."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+@asynccontextmanager
+async def spooled_download(url: str, suffix: str = ".png") -> AsyncIterator[str]:
+    """
+    Stream `url` into a temp file in DOWNLOAD_CHUNK_SIZE chunks.
+    Yields the file path; the file is removed when the block exits.
+    """
+    import httpx
+
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=IMAGE_TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async with httpx.AsyncClient(timeout=60.0) as http_client:
+                async with http_client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def render_derivatives(source: Union[bytes, str], sizes: Iterable[int]) -> Dict[int, bytes]:
+    """
+    Decode once, center crop to a square and encode a PNG per size.
+    `source` is raw image bytes or a file path. Runs inside a worker process.
+    """
+    from PIL import Image
+    import io
+
+    img = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    img.load()
+
+    # Center crop to square (already square from DALL-E but being safe)
+    width, height = img.size
+    min_dim = min(width, height)
+    left = (width - min_dim) // 2
+    top = (height - min_dim) // 2
+    img_cropped = img.crop((left, top, left + min_dim, top + min_dim))
+
+    derivatives = {}
+    for size in sorted(set(sizes), reverse=True):
+        resized = img_cropped.resize((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, format="PNG")
+        derivatives[size] = buffer.getvalue()
+    return derivatives
+
+
+async def create_derivatives(
+    source: Union[bytes, str],
+    sizes: Optional[Iterable[int]] = None
+) -> Dict[int, bytes]:
+    """
+    Render derivatives in the process pool without blocking the event loop.
+    Pass a file path to keep the full-size image out of this process's memory.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_process_pool(),
+        render_derivatives,
+        source,
+        tuple(sizes or THUMBNAIL_SIZES)
+    )
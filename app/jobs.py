@@ -0,0 +1,369 @@
+"""
+Durable batch job store.
+Image, audio and content batches record per-item state in batch_jobs /
+batch_job_items and checkpoint after every item, so progress is shared
+across replicas and a crashed batch resumes where it stopped.
+
+All functions are blocking and open their own short-lived Session; call
+them from async code through app.database.run_db.
+"""
+import os
+import json
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from app import models
+from app.database import SessionLocal, get_engine
+
+# A running job whose last checkpoint is older than this is treated as crashed
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+# Failed items are retried on resume until they reach this many attempts
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How long start_or_resume_job waits for another replica's start to finish
+JOB_LOCK_TIMEOUT_MS = int(os.getenv("JOB_LOCK_TIMEOUT_MS", "10000"))
+
+RUNNING = "running"
+PENDING = "pending"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobItemNotFound(LookupError):
+    """A checkpoint named an item that is not part of the job."""
+
+    def __init__(self, job_id: int, item_key: str):
+        self.job_id = job_id
+        self.item_key = item_key
+        super().__init__(f"Batch job {job_id} has no item {item_key!r}")
+
+
+class JobInProgress(Exception):
+    """Another worker is actively running a job of this kind."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        super().__init__(f"Batch job {job_id} is already in progress")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _session():
+    get_engine()
+    return SessionLocal()
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _latest_job(db, kind: str, for_update: bool = False) -> Optional[models.BatchJob]:
+    query = db.query(models.BatchJob).filter(models.BatchJob.kind == kind)
+    if for_update:
+        query = query.with_for_update()
+    return query.order_by(models.BatchJob.id.desc()).first()
+
+
+def _lock_kind(db, kind: str):
+    """
+    Hold an exclusive lock on `kind` until the transaction ends, so replicas
+    cannot both create or both resume a job. SQL Server uses an application
+    lock (there may be no job row to lock yet); other databases rely on
+    _latest_job(for_update=True).
+    """
+    if db.get_bind().dialect.name != "mssql":
+        return
+    from sqlalchemy import text
+
+    result = db.execute(text(
+        "SET NOCOUNT ON; DECLARE @result int; "
+        "EXEC @result = sp_getapplock @Resource = :resource, @LockMode = 'Exclusive', "
+        "@LockOwner = 'Transaction', @LockTimeout = :timeout_ms; "
+        "SELECT @result"
+    ), {"resource": f"batch_job:{kind}", "timeout_ms": JOB_LOCK_TIMEOUT_MS}).scalar()
+    if result is None or result < 0:
+        raise RuntimeError(f"Could not lock batch job kind {kind!r} (sp_getapplock returned {result})")
+
+
+def start_or_resume_job(kind: str, item_keys: List[str], params: Optional[Dict] = None) -> Dict:
+    """
+    Resume the latest unfinished job of `kind`, or create a new one.
+
+    Returns {"job_id", "pending": [keys to process], "resumed": bool, "params"}.
+    A resumed job keeps the params it was created with.
+    Raises JobInProgress if a job of this kind checkpointed recently.
+    """
+    with _session() as db:
+        _lock_kind(db, kind)
+        job = _latest_job(db, kind, for_update=True)
+        now = _now()
+
+        if job and job.status == RUNNING:
+            heartbeat = _as_utc(job.heartbeat_at) or _as_utc(job.created_at)
+            if heartbeat and now - heartbeat < timedelta(seconds=JOB_STALE_SECONDS):
+                raise JobInProgress(job.id)
+
+            # Crashed job: requeue interrupted items, add items new since it started
+            existing = {item.item_key: item for item in job.items}
+            for item in existing.values():
+                if item.status == RUNNING:
+                    item.status = PENDING
+                elif item.status == FAILED and (item.attempts or 0) < JOB_MAX_ATTEMPTS:
+                    item.status = PENDING
+            for key in item_keys:
+                if key not in existing:
+                    db.add(models.BatchJobItem(job_id=job.id, item_key=key, status=PENDING, attempts=0))
+            job.total = len(set(existing) | set(item_keys))
+            job.heartbeat_at = now
+            db.commit()
+
+            pending = [
+                item.item_key for item in db.query(models.BatchJobItem).filter(
+                    models.BatchJobItem.job_id == job.id,
+                    models.BatchJobItem.status == PENDING
+                ).order_by(models.BatchJobItem.id).all()
+            ]
+            return {
+                "job_id": job.id,
+                "pending": pending,
+                "resumed": True,
+                "params": json.loads(job.params) if job.params else {}
+            }
+
+        job = models.BatchJob(
+            kind=kind,
+            status=RUNNING,
+            total=len(item_keys),
+            params=json.dumps(params or {}),
+            created_at=now,
+            heartbeat_at=now
+        )
+        db.add(job)
+        db.flush()
+        db.add_all([
+            models.BatchJobItem(job_id=job.id, item_key=key, status=PENDING, attempts=0)
+            for key in item_keys
+        ])
+        db.commit()
+        return {"job_id": job.id, "pending": list(item_keys), "resumed": False, "params": params or {}}
+
+
+def _get_item(db, job_id: int, item_key: str) -> models.BatchJobItem:
+    item = db.query(models.BatchJobItem).filter(
+        models.BatchJobItem.job_id == job_id,
+        models.BatchJobItem.item_key == item_key
+    ).first()
+    if item is None:
+        raise JobItemNotFound(job_id, item_key)
+    return item
+
+
+def _touch_job(db, job_id: int, now: datetime):
+    db.query(models.BatchJob).filter(models.BatchJob.id == job_id).update(
+        {"heartbeat_at": now}, synchronize_session=False
+    )
+
+
+def touch_job(job_id: int):
+    """Heartbeat for long waits between checkpoints (e.g. polling a remote batch)."""
+    with _session() as db:
+        _touch_job(db, job_id, _now())
+        db.commit()
+
+
+def update_job_params(job_id: int, params: Dict):
+    """Merge `params` into the job's stored params."""
+    with _session() as db:
+        job = db.get(models.BatchJob, job_id)
+        merged = json.loads(job.params) if job.params else {}
+        merged.update(params)
+        job.params = json.dumps(merged)
+        _touch_job(db, job_id, _now())
+        db.commit()
+
+
+def mark_item_running(job_id: int, item_key: str):
+    """Checkpoint: item started (counts an attempt)."""
+    with _session() as db:
+        now = _now()
+        item = _get_item(db, job_id, item_key)
+        item.status = RUNNING
+        item.attempts = (item.attempts or 0) + 1
+        item.started_at = now
+        item.error = None
+        _touch_job(db, job_id, now)
+        db.commit()
+
+
+def _finish_item(job_id: int, item_key: str, status: str, result: Optional[Dict], error: Optional[str]):
+    with _session() as db:
+        now = _now()
+        item = _get_item(db, job_id, item_key)
+        item.status = status
+        item.finished_at = now
+        started = _as_utc(item.started_at)
+        item.duration_ms = int((now - started).total_seconds() * 1000) if started else None
+        item.result = json.dumps(result) if result is not None else None
+        item.error = error
+        _touch_job(db, job_id, now)
+        db.commit()
+
+
+def mark_item_succeeded(job_id: int, item_key: str, result: Optional[Dict] = None):
+    """Checkpoint: item finished successfully."""
+    _finish_item(job_id, item_key, SUCCEEDED, result, None)
+
+
+def stage_items_succeeded(db, job_id: int, results: Dict[str, Optional[Dict]]):
+    """
+    Checkpoint several finished items in the caller's Session without
+    committing, so they land in the same transaction as the items' data.
+    """
+    if not results:
+        return
+    now = _now()
+    items = db.query(models.BatchJobItem).filter(
+        models.BatchJobItem.job_id == job_id,
+        models.BatchJobItem.item_key.in_(list(results))
+    ).all()
+    for item in items:
+        result = results[item.item_key]
+        started = _as_utc(item.started_at)
+        item.status = SUCCEEDED
+        item.finished_at = now
+        item.duration_ms = int((now - started).total_seconds() * 1000) if started else None
+        item.result = json.dumps(result) if result is not None else None
+        item.error = None
+    _touch_job(db, job_id, now)
+
+
+def mark_items_succeeded(job_id: int, results: Dict[str, Optional[Dict]]):
+    """Checkpoint several finished items in one transaction."""
+    if not results:
+        return
+    with _session() as db:
+        stage_items_succeeded(db, job_id, results)
+        db.commit()
+
+
+def mark_item_failed(job_id: int, item_key: str, error: str):
+    """Checkpoint: item failed (retried on resume until JOB_MAX_ATTEMPTS)."""
+    _finish_item(job_id, item_key, FAILED, None, error)
+
+
+def fail_unfinished_items(job_id: int, error: str) -> int:
+    """Mark every pending or running item failed (e.g. a remote batch that never answered them)."""
+    with _session() as db:
+        now = _now()
+        count = db.query(models.BatchJobItem).filter(
+            models.BatchJobItem.job_id == job_id,
+            models.BatchJobItem.status.in_([PENDING, RUNNING])
+        ).update({"status": FAILED, "error": error, "finished_at": now}, synchronize_session=False)
+        _touch_job(db, job_id, now)
+        db.commit()
+        return count
+
+
+def finish_job(job_id: int) -> str:
+    """
+    Close a job. Returns the final status: "completed", or
+    "completed_with_errors" if any item failed or was never finished;
+    a cancelled job stays "cancelled".
+    """
+    with _session() as db:
+        job = db.get(models.BatchJob, job_id)
+        if job.status == CANCELLED:
+            return job.status
+        incomplete = db.query(models.BatchJobItem).filter(
+            models.BatchJobItem.job_id == job_id,
+            models.BatchJobItem.status != SUCCEEDED
+        ).count()
+        job.status = "completed_with_errors" if incomplete else "completed"
+        job.finished_at = _now()
+        job.heartbeat_at = job.finished_at
+        db.commit()
+        return job.status
+
+
+def fail_job(job_id: int, error: str):
+    """Close a job that could not run at all (the error is kept in its params)."""
+    with _session() as db:
+        job = db.get(models.BatchJob, job_id)
+        if job.status == CANCELLED:
+            return
+        params = json.loads(job.params) if job.params else {}
+        params["error"] = error
+        job.params = json.dumps(params)
+        job.status = FAILED
+        job.finished_at = _now()
+        db.commit()
+
+
+def cancel_active_job(kind: str) -> Optional[int]:
+    """Stop the latest running job of `kind` from being resumed. Returns its id."""
+    with _session() as db:
+        job = _latest_job(db, kind)
+        if not job or job.status != RUNNING:
+            return None
+        job.status = CANCELLED
+        job.finished_at = _now()
+        db.commit()
+        return job.id
+
+
+def is_cancelled(job_id: int) -> bool:
+    """Whether the job was cancelled; workers check this before each item."""
+    with _session() as db:
+        job = db.get(models.BatchJob, job_id)
+        return job is not None and job.status == CANCELLED
+
+
+def get_job_status(kind: str) -> Optional[Dict]:
+    """Progress of the latest job of `kind`, or None if there has never been one."""
+    with _session() as db:
+        job = _latest_job(db, kind)
+        if not job:
+            return None
+
+        items = db.query(models.BatchJobItem).filter(
+            models.BatchJobItem.job_id == job.id
+        ).order_by(models.BatchJobItem.id).all()
+
+        counts = {PENDING: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        for item in items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+
+        heartbeat = _as_utc(job.heartbeat_at)
+        stale = (
+            job.status == RUNNING and heartbeat is not None
+            and _now() - heartbeat >= timedelta(seconds=JOB_STALE_SECONDS)
+        )
+
+        return {
+            "job_id": job.id,
+            "kind": job.kind,
+            "status": "interrupted" if stale else job.status,
+            "total": job.total or len(items),
+            "params": json.loads(job.params) if job.params else {},
+            "pending": counts[PENDING],
+            "running": counts[RUNNING],
+            "succeeded": counts[SUCCEEDED],
+            "failed": counts[FAILED],
+            "in_flight": [item.item_key for item in items if item.status == RUNNING],
+            "in_progress": job.status == RUNNING and not stale,
+            "errors": [
+                {"item": item.item_key, "error": item.error, "attempts": item.attempts}
+                for item in items if item.status == FAILED
+            ],
+            "results": {
+                item.item_key: json.loads(item.result)
+                for item in items if item.status == SUCCEEDED and item.result
+            },
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "heartbeat_at": heartbeat.isoformat() if heartbeat else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
@@ -1,26 +1,85 @@
-from fastapi import FastAPI, Depends, HTTPException
+from app.startup import (
+    PROCESS_START,
+    startup_phase,
+    record_phase_since,
+    mark_ready,
+    get_startup_report,
+    format_startup_report
+)
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, RedirectResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List
+from contextlib import asynccontextmanager
 import os
 
 from app import models, schemas, crud
-from app.database import engine, get_db, Base
+from app.database import (
+    get_engine,
+    get_db,
+    Base,
+    prewarm_pool,
+    get_pool_status,
+    THREADPOOL_SIZE,
+    DB_POOL_PREWARM
+)
 from app.image_test.routes import router as image_test_router
 from app.image_gen.routes import router as image_gen_router
 from app.audio.routes import router as audio_router
 from app.content.routes import router as content_router
 from app.image_gen.figure_prompts import FIGURE_PROMPTS
+from app.openai_client import init_openai_client, close_openai_client
+from app.imaging import shutdown_process_pool
+from app import metrics
+from app.versioning import conditional_get, ensure_version_row
+
+record_phase_since("imports", PROCESS_START)
+
+# Boot phases; set to "0" on Cloud Run to defer the work to first use
+STARTUP_RESOLVE_SECRETS = os.getenv("STARTUP_RESOLVE_SECRETS", "1") == "1"
+STARTUP_CREATE_TABLES = os.getenv("STARTUP_CREATE_TABLES", "1") == "1"
+STARTUP_EAGER_CLIENTS = os.getenv("STARTUP_EAGER_CLIENTS", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run boot phases, then close shared provider clients on shutdown."""
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    with startup_phase("resolve_secrets", enabled=STARTUP_RESOLVE_SECRETS):
+        get_engine()
+
+    with startup_phase("create_tables", enabled=STARTUP_CREATE_TABLES):
+        Base.metadata.create_all(bind=get_engine())
+        ensure_version_row()
+
+    with startup_phase("prewarm_pool", enabled=DB_POOL_PREWARM > 0):
+        await anyio.to_thread.run_sync(prewarm_pool)
+
+    try:
+        with startup_phase("openai_client", enabled=STARTUP_EAGER_CLIENTS):
+            init_openai_client()
+    except Exception as e:
+        # Generators retry lazily on first use
+        print(f"OpenAI client not initialised at startup: {e}")
+
+    mark_ready()
+    print(format_startup_report())
+    yield
+    await close_openai_client()
+    shutdown_process_pool()
+    metrics.flush_db_sink()
 
-# Create tables
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Etymython API",
     description="Greek mythology etymology learning system",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Serve static files
@@ -51,6 +110,27 @@ def health():
     return {"status": "healthy"}
 
 
+@app.get("/api/v1/startup-report")
+def startup_report():
+    """Per-phase boot timings for this instance."""
+    return get_startup_report()
+
+
+@app.get("/api/v1/db/pool")
+def db_pool_status():
+    """Connection pool occupancy and checkout wait times."""
+    return get_pool_status()
+
+
+@app.get("/api/v1/metrics/providers")
+def provider_metrics(reset: bool = False):
+    """Provider call counts, usage, latency percentiles and estimated cost (this process)."""
+    report = metrics.summary()
+    if reset:
+        metrics.reset()
+    return report
+
+
 @app.post("/api/v1/migrate-schema")
 def migrate_schema(db: Session = Depends(get_db)):
     """Add new columns to mythological_figures table"""
@@ -136,21 +216,38 @@ def seed_database(db: Session = Depends(get_db)):
 
 # Figures endpoints
 @app.get("/api/v1/figures", response_model=List[schemas.Figure])
-def list_figures(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_figures(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    if not_modified := conditional_get(request, response):
+        return not_modified
     return crud.get_figures(db, skip=skip, limit=limit)
 
 
 @app.get("/api/v1/figures/{figure_id}", response_model=schemas.FigureWithRelations)
-def get_figure(figure_id: int, db: Session = Depends(get_db)):
-    figure = crud.get_figure(db, figure_id)
+def get_figure(
+    figure_id: int,
+    request: Request,
+    response: Response,
+    include: str = Query("etymologies,fun_facts", description="Comma-separated: etymologies, cognates, fun_facts"),
+    db: Session = Depends(get_db)
+):
+    """Figure detail; relations named in `include` are eager-loaded, the rest returned empty."""
+    relations = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = relations - set(crud.FIGURE_INCLUDES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    if not_modified := conditional_get(request, response):
+        return not_modified
+    figure = crud.get_figure(db, figure_id, include=relations)
     if not figure:
         raise HTTPException(status_code=404, detail="Figure not found")
     return figure
 
 
 @app.get("/api/v1/figures/{figure_id}/chain")
-def get_figure_etymology_chain(figure_id: int, db: Session = Depends(get_db)):
+def get_figure_etymology_chain(figure_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get complete etymology chain: figure → etymologies → cognates"""
+    if not_modified := conditional_get(request, response):
+        return not_modified
     query = text("""
         SELECT 
             f.id as figure_id,
@@ -240,7 +337,9 @@ def delete_figure(figure_id: int, db: Session = Depends(get_db)):
 
 # Etymologies endpoints
 @app.get("/api/v1/etymologies", response_model=List[schemas.Etymology])
-def list_etymologies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_etymologies(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    if not_modified := conditional_get(request, response):
+        return not_modified
     return crud.get_etymologies(db, skip=skip, limit=limit)
 
 
@@ -251,7 +350,9 @@ def create_etymology(etymology: schemas.EtymologyCreate, db: Session = Depends(g
 
 # Cognates endpoints
 @app.get("/api/v1/cognates", response_model=List[schemas.Cognate])
-def list_cognates(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_cognates(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    if not_modified := conditional_get(request, response):
+        return not_modified
     return crud.get_cognates(db, skip=skip, limit=limit)
 
 
@@ -265,7 +366,9 @@ def create_cognate(cognate: schemas.CognateCreate, db: Session = Depends(get_db)
 
 # Fun facts endpoints
 @app.get("/api/v1/figures/{figure_id}/facts", response_model=List[schemas.FunFact])
-def get_figure_facts(figure_id: int, db: Session = Depends(get_db)):
+def get_figure_facts(figure_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    if not_modified := conditional_get(request, response):
+        return not_modified
     figure = crud.get_figure(db, figure_id)
     if not figure:
         raise HTTPException(status_code=404, detail="Figure not found")
@@ -294,8 +397,10 @@ def link_etymology_to_cognate(etymology_id: int, cognate_id: int, db: Session =
 
 
 @app.get("/api/v1/relationships")
-def get_all_relationships(db: Session = Depends(get_db)):
+def get_all_relationships(request: Request, response: Response, db: Session = Depends(get_db)):
     """Get all figure relationships for graph edges"""
+    if not_modified := conditional_get(request, response):
+        return not_modified
     query = text("""
         SELECT 
             fr.figure1_id as source_id,
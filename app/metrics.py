@@ -0,0 +1,262 @@
+"""
+Per-call accounting for paid provider APIs (OpenAI chat and images, Google TTS).
+Each call records latency, usage (tokens, images, characters), outcome and
+error class into a rolling in-process store; summaries give latency
+percentiles and estimated cost per provider/operation/model.
+
+Records can also be written to the provider_calls table (METRICS_DB_SINK=1).
+"""
+import os
+import time
+import threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+# Recent calls kept per provider/operation/model for percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+METRICS_DB_SINK = os.getenv("METRICS_DB_SINK", "0") == "1"
+METRICS_DB_FLUSH_SIZE = int(os.getenv("METRICS_DB_FLUSH_SIZE", "50"))
+
+# USD list prices; override when pricing changes
+CHAT_PRICES_PER_MILLION = {  # (prompt, completion) tokens
+    "gpt-4o": (
+        float(os.getenv("PRICE_GPT4O_INPUT_PER_M", "2.50")),
+        float(os.getenv("PRICE_GPT4O_OUTPUT_PER_M", "10.00"))
+    ),
+}
+IMAGE_PRICES = {  # per image, by model:quality
+    "dall-e-3:standard": float(os.getenv("PRICE_DALLE3_STANDARD", "0.04")),
+    "dall-e-3:hd": float(os.getenv("PRICE_DALLE3_HD", "0.08")),
+}
+TTS_PRICES_PER_MILLION_CHARS = {  # by voice family
+    "Wavenet": float(os.getenv("PRICE_TTS_WAVENET_PER_M", "16.00")),
+    "Neural2": float(os.getenv("PRICE_TTS_NEURAL2_PER_M", "16.00")),
+    "Standard": float(os.getenv("PRICE_TTS_STANDARD_PER_M", "4.00")),
+}
+# The Batch API bills half the synchronous price
+BATCH_DISCOUNT = 0.5
+
+_lock = threading.Lock()
+_series: Dict[tuple, dict] = {}
+_pending_rows: List[dict] = []
+
+
+def image_price(model: str, quality: str = "standard") -> float:
+    """Price of one generated image."""
+    return IMAGE_PRICES.get(f"{model}:{quality}", IMAGE_PRICES["dall-e-3:standard"])
+
+
+def estimate_cost(
+    provider: str,
+    model: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    images: int = 0,
+    characters: int = 0,
+    batch: bool = False
+) -> float:
+    """Estimated USD cost of a call from its usage."""
+    cost = 0.0
+    if prompt_tokens or completion_tokens:
+        input_price, output_price = CHAT_PRICES_PER_MILLION.get(
+            model, CHAT_PRICES_PER_MILLION["gpt-4o"]
+        )
+        cost += (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    if images:
+        model_name, _, quality = model.partition(":")
+        cost += images * image_price(model_name, quality or "standard")
+    if characters:
+        family = next((f for f in TTS_PRICES_PER_MILLION_CHARS if f in model), "Wavenet")
+        cost += characters * TTS_PRICES_PER_MILLION_CHARS[family] / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def _new_series() -> dict:
+    return {
+        "calls": 0,
+        "errors": 0,
+        "cancelled": 0,
+        "cache_hits": 0,
+        "error_classes": defaultdict(int),
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "images": 0,
+        "characters": 0,
+        "cost_usd": 0.0,
+        "latencies_ms": deque(maxlen=METRICS_WINDOW),
+        "first_at": time.time(),
+        "last_at": None
+    }
+
+
+def record_call(
+    provider: str,
+    operation: str,
+    model: str,
+    latency_ms: float,
+    error_class: Optional[str] = None,
+    cached: bool = False,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    images: int = 0,
+    characters: int = 0,
+    batch: bool = False,
+    cancelled: bool = False
+):
+    """
+    Record one provider call (cache hits are counted but cost nothing).
+    A call abandoned by our side (client disconnect, task cancel) is only
+    counted as cancelled: it is neither a provider error nor a latency sample.
+    """
+    cost = 0.0 if cached or error_class or cancelled else estimate_cost(
+        provider, model, prompt_tokens, completion_tokens, images, characters, batch
+    )
+    with _lock:
+        series = _series.setdefault((provider, operation, model), _new_series())
+        series["calls"] += 1
+        series["last_at"] = time.time()
+        if cancelled:
+            series["cancelled"] += 1
+            return
+        if cached:
+            series["cache_hits"] += 1
+        else:
+            series["latencies_ms"].append(latency_ms)
+        if error_class:
+            series["errors"] += 1
+            series["error_classes"][error_class] += 1
+        series["prompt_tokens"] += prompt_tokens
+        series["completion_tokens"] += completion_tokens
+        series["images"] += images
+        series["characters"] += characters
+        series["cost_usd"] += cost
+
+        if METRICS_DB_SINK:
+            _pending_rows.append({
+                "provider": provider,
+                "operation": operation,
+                "model": model,
+                "latency_ms": int(latency_ms),
+                "success": error_class is None,
+                "error_class": error_class,
+                "cached": cached,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "images": images,
+                "characters": characters,
+                "cost_usd": cost,
+                "created_at": datetime.now(timezone.utc)
+            })
+            flush = len(_pending_rows) >= METRICS_DB_FLUSH_SIZE
+        else:
+            flush = False
+    if flush:
+        threading.Thread(target=flush_db_sink, daemon=True).start()
+
+
+@contextmanager
+def track(provider: str, operation: str, model: str) -> Iterator[dict]:
+    """
+    Time a provider call and record it on exit. The caller fills usage into
+    the yielded dict (prompt_tokens, completion_tokens, images, characters,
+    cached, batch); an exception is recorded by class and re-raised, and a
+    cancellation is recorded as cancelled.
+    """
+    usage: dict = {}
+    start = time.perf_counter()
+    try:
+        yield usage
+    except Exception as e:
+        record_call(
+            provider, operation, model,
+            (time.perf_counter() - start) * 1000,
+            error_class=type(e).__name__,
+            **usage
+        )
+        raise
+    except BaseException:
+        record_call(provider, operation, model, 0, cancelled=True, **usage)
+        raise
+    record_call(provider, operation, model, (time.perf_counter() - start) * 1000, **usage)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 1)
+
+
+def summary() -> Dict:
+    """Per provider/operation/model totals, latency percentiles and estimated cost."""
+    with _lock:
+        snapshot = {
+            key: {**series, "latencies_ms": sorted(series["latencies_ms"]),
+                  "error_classes": dict(series["error_classes"])}
+            for key, series in _series.items()
+        }
+
+    rows = []
+    for (provider, operation, model), series in sorted(snapshot.items()):
+        latencies = series["latencies_ms"]
+        uncached = series["calls"] - series["cache_hits"] - series["cancelled"]
+        rows.append({
+            "provider": provider,
+            "operation": operation,
+            "model": model,
+            "calls": series["calls"],
+            "cache_hits": series["cache_hits"],
+            "errors": series["errors"],
+            "cancelled": series["cancelled"],
+            "error_rate": round(series["errors"] / uncached, 3) if uncached else 0,
+            "error_classes": series["error_classes"],
+            "prompt_tokens": series["prompt_tokens"],
+            "completion_tokens": series["completion_tokens"],
+            "images": series["images"],
+            "characters": series["characters"],
+            "estimated_cost_usd": round(series["cost_usd"], 4),
+            "latency_ms": {
+                "window": len(latencies),
+                "p50": _percentile(latencies, 50),
+                "p90": _percentile(latencies, 90),
+                "p99": _percentile(latencies, 99),
+                "max": round(latencies[-1], 1) if latencies else None
+            },
+            "last_call_at": datetime.fromtimestamp(series["last_at"], timezone.utc).isoformat()
+            if series["last_at"] else None
+        })
+    return {
+        "total_estimated_cost_usd": round(sum(r["estimated_cost_usd"] for r in rows), 4),
+        "providers": rows
+    }
+
+
+def reset():
+    """Clear the in-process store."""
+    with _lock:
+        _series.clear()
+
+
+def flush_db_sink() -> int:
+    """Write pending call records to provider_calls. Returns the number written."""
+    with _lock:
+        rows = list(_pending_rows)
+        _pending_rows.clear()
+    if not rows:
+        return 0
+
+    from app import models
+    from app.database import SessionLocal, get_engine
+
+    try:
+        get_engine()
+        with SessionLocal() as db:
+            db.add_all([models.ProviderCall(**row) for row in rows])
+            db.commit()
+    except Exception as e:
+        # Accounting must never break generation; drop the batch
+        print(f"Metrics DB sink error ({len(rows)} records dropped): {e}")
+        return 0
+    return len(rows)
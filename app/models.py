@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Table, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Table, DateTime, Boolean, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -99,3 +99,68 @@ class FunFact(Base):
     
     # Relationships
     figure = relationship("MythologicalFigure", back_populates="fun_facts")
+
+
+class BatchJob(Base):
+    __tablename__ = 'batch_jobs'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), index=True)  # images, audio, content
+    status = Column(String(30))  # running, completed, completed_with_errors, cancelled
+    total = Column(Integer)
+    params = Column(Text)  # JSON
+    created_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))  # last checkpoint; stale => resumable
+    finished_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    items = relationship("BatchJobItem", back_populates="job")
+
+
+class BatchJobItem(Base):
+    __tablename__ = 'batch_job_items'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey('batch_jobs.id'), index=True)
+    item_key = Column(String(200))  # figure name or id
+    status = Column(String(20))  # pending, running, succeeded, failed
+    attempts = Column(Integer, default=0)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    duration_ms = Column(Integer)
+    error = Column(Text)
+    result = Column(Text)  # JSON
+    
+    # Relationships
+    job = relationship("BatchJob", back_populates="items")
+
+
+class ProviderCall(Base):
+    __tablename__ = 'provider_calls'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(50), index=True)  # openai, google_tts
+    operation = Column(String(100))  # chat.completions, images.generate, synthesize
+    model = Column(String(100))  # gpt-4o, dall-e-3:standard, el-GR-Wavenet-A
+    latency_ms = Column(Integer)
+    success = Column(Boolean)
+    error_class = Column(String(100))
+    cached = Column(Boolean)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    images = Column(Integer)
+    characters = Column(Integer)
+    cost_usd = Column(Float)  # estimated from list prices
+    created_at = Column(DateTime(timezone=True), index=True)
+
+
+class DatasetVersion(Base):
+    __tablename__ = 'dataset_versions'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # single row, id 1
+    version = Column(Integer, nullable=False)  # bumped by every figure/etymology/cognate/fact write
+    updated_at = Column(DateTime(timezone=True))
+
+
+# Bump the dataset version from every session that writes these models
+from app import versioning  # noqa: E402,F401
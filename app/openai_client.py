@@ -0,0 +1,57 @@
+"""
+Shared AsyncOpenAI client.
+One long-lived client per process so content and image generation reuse warm
+connections instead of paying a TLS handshake on every request.
+"""
+import os
+from typing import Optional, TYPE_CHECKING
+
+from app.config import get_openai_api_key
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Connection pool configuration
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+_client: Optional["AsyncOpenAI"] = None
+
+
+def init_openai_client() -> "AsyncOpenAI":
+    """Create the shared client. Called from the app lifespan; safe to call twice."""
+    global _client
+    if _client is None:
+        # Imported here so the SDK is only loaded when first needed
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=OPENAI_TIMEOUT,
+        )
+        _client = AsyncOpenAI(
+            api_key=get_openai_api_key(),
+            timeout=OPENAI_TIMEOUT,
+            http_client=http_client,
+        )
+    return _client
+
+
+def get_shared_openai_client() -> "AsyncOpenAI":
+    """Return the shared client, creating it on first use outside the app (scripts)."""
+    return _client or init_openai_client()
+
+
+async def close_openai_client():
+    """Close the shared client and its connection pool. Called on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,92 @@
+"""
+Async token-bucket rate limiter for provider APIs.
+Batch jobs acquire a token before each request; 429 responses shrink the
+rate and pause the bucket, and successes grow it back to the configured rate.
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket allowing `rate_per_minute` requests with bursts up to `capacity`."""
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: Optional[float] = None,
+        min_rate_per_minute: float = 1.0,
+        max_backoff_seconds: float = 60.0
+    ):
+        if rate_per_minute <= 0:
+            raise ValueError(f"rate_per_minute must be positive, got {rate_per_minute}")
+        if min_rate_per_minute <= 0:
+            raise ValueError(f"min_rate_per_minute must be positive, got {min_rate_per_minute}")
+        self.max_rate = rate_per_minute
+        self.rate = rate_per_minute
+        self.min_rate = min(min_rate_per_minute, rate_per_minute)
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6)
+        self.max_backoff = max_backoff_seconds
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self.throttled = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate / 60.0)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * 60.0 / self.rate)
+
+    def record_success(self):
+        """Additive increase back toward the configured rate."""
+        self.consecutive_throttles = 0
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def record_throttle(self, retry_after: Optional[float] = None) -> float:
+        """Multiplicative decrease plus a pause after a 429. Returns the pause in seconds."""
+        self.throttled += 1
+        self.consecutive_throttles += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        backoff = retry_after if retry_after else min(self.max_backoff, 2 ** self.consecutive_throttles)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+        self.tokens = 0
+        return backoff
+
+    def snapshot(self) -> dict:
+        return {
+            "rate_per_minute": round(self.rate, 2),
+            "configured_rate_per_minute": self.max_rate,
+            "throttled": self.throttled
+        }
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read Retry-After from an OpenAI/httpx error response, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
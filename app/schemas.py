@@ -109,10 +109,11 @@ class FunFact(FunFactBase):
 
 
 # Extended schemas with relationships
-class FigureWithRelations(Figure):
-    etymologies: List[Etymology] = []
-    fun_facts: List[FunFact] = []
-
-
 class EtymologyWithCognates(Etymology):
     cognates: List[Cognate] = []
+
+
+class FigureWithRelations(Figure):
+    # Relations left out of the request's include= are returned empty
+    etymologies: List[EtymologyWithCognates] = []
+    fun_facts: List[FunFact] = []
@@ -0,0 +1,66 @@
+"""
+Startup timeline.
+Records how long each boot phase takes so cold starts can be compared
+release over release.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Set when this module is first imported (app.main imports it first)
+PROCESS_START = time.perf_counter()
+
+startup_report = {
+    "started_at": datetime.now(timezone.utc).isoformat(),
+    "phases": [],
+    "total_ms": None,
+    "ready": False
+}
+
+
+@contextmanager
+def startup_phase(name: str, enabled: bool = True):
+    """Time a boot phase. Disabled phases are recorded as skipped."""
+    if not enabled:
+        startup_report["phases"].append({"name": name, "ms": 0.0, "status": "skipped"})
+        yield
+        return
+
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception as e:
+        status = f"failed: {type(e).__name__}: {e}"
+        raise
+    finally:
+        startup_report["phases"].append({
+            "name": name,
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+            "status": status
+        })
+
+
+def record_phase_since(name: str, start: float):
+    """Record a phase that started at `start` (perf_counter) and ends now."""
+    startup_report["phases"].append({
+        "name": name,
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+        "status": "ok"
+    })
+
+
+def mark_ready():
+    """Mark startup complete and compute total time since process import."""
+    startup_report["total_ms"] = round((time.perf_counter() - PROCESS_START) * 1000, 1)
+    startup_report["ready"] = True
+
+
+def get_startup_report() -> dict:
+    return startup_report
+
+
+def format_startup_report() -> str:
+    phases = ", ".join(f"{p['name']}={p['ms']}ms" if p["status"] == "ok" else f"{p['name']}={p['status']}"
+                       for p in startup_report["phases"])
+    return f"Startup {startup_report['total_ms']}ms ({phases})"
@@ -0,0 +1,77 @@
+"""
+Aggregated generation status for the content, audio and image dashboards.
+One pass over mythological_figures (joined with per-figure fun fact counts)
+computes every counter with conditional SUMs; the result is cached for
+STATUS_CACHE_TTL seconds so polling dashboards share a single query.
+"""
+import os
+import time
+import threading
+from typing import Dict
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "5"))  # seconds; 0 disables caching
+
+_lock = threading.Lock()
+_cached: Dict = {"value": None, "expires_at": 0.0}
+
+
+def _present(column):
+    return func.sum(case((column.isnot(None), 1), else_=0))
+
+
+def _query_figure_status(db: Session) -> Dict:
+    figure = models.MythologicalFigure
+    fact_counts = (
+        select(models.FunFact.figure_id, func.count(models.FunFact.id).label("facts"))
+        .group_by(models.FunFact.figure_id)
+        .subquery()
+    )
+    row = db.execute(
+        select(
+            func.count(figure.id),
+            _present(figure.origin_story),
+            _present(figure.pronunciation_audio_url),
+            _present(figure.image_url),
+            func.sum(func.coalesce(fact_counts.c.facts, 0)),
+            func.count(fact_counts.c.figure_id)
+        )
+        .select_from(figure)
+        .outerjoin(fact_counts, fact_counts.c.figure_id == figure.id)
+    ).one()
+    total, stories, audio, images, facts, figures_with_facts = (value or 0 for value in row)
+    return {
+        "total_figures": total,
+        "with_origin_stories": stories,
+        "with_audio": audio,
+        "with_images": images,
+        "total_fun_facts": facts,
+        "figures_with_fun_facts": figures_with_facts
+    }
+
+
+def get_figure_status(db: Session) -> Dict:
+    """Figure counters (cached for STATUS_CACHE_TTL seconds). Blocking."""
+    now = time.monotonic()
+    with _lock:
+        if _cached["value"] is not None and now < _cached["expires_at"]:
+            return dict(_cached["value"])
+    value = _query_figure_status(db)
+    with _lock:
+        _cached["value"] = value
+        _cached["expires_at"] = time.monotonic() + STATUS_CACHE_TTL
+    return dict(value)
+
+
+def invalidate():
+    """Drop the cached counters so the next read queries again."""
+    with _lock:
+        _cached["value"] = None
+
+
+def percentage(part: int, total: int) -> float:
+    return round((part / total * 100) if total > 0 else 0, 1)
@@ -0,0 +1,196 @@
+"""
+Shared Google Cloud Storage access for the media pipelines.
+One storage client per process with a pooled HTTP transport and cached
+bucket handles, used by image_gen, image_test and audio. The async helpers
+run uploads on worker threads so they never block the event loop.
+"""
+import os
+import json
+import asyncio
+import threading
+from typing import Dict, Iterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.cloud import storage
+
+BUCKET_NAME = "etymython-media"
+PROJECT_ID = os.getenv("GCP_PROJECT_ID", "etymython-project")
+GCS_POOL_SIZE = int(os.getenv("GCS_POOL_SIZE", "32"))  # keep-alive connections to storage.googleapis.com
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv("GCS_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # multiple of 256 KB
+GCS_UPLOAD_CONCURRENCY = int(os.getenv("GCS_UPLOAD_CONCURRENCY", "8"))  # parallel uploads per batch
+
+# How objects become publicly readable:
+#   "object" - publicRead ACL set in the upload request itself (no extra ACL call)
+#   "bucket" - bucket grants allUsers objectViewer (uniform access); no per-object ACL
+GCS_PUBLIC_ACCESS = os.getenv("GCS_PUBLIC_ACCESS", "object")
+
+_client: Optional["storage.Client"] = None
+_buckets: Dict[str, "storage.Bucket"] = {}
+_lock = threading.Lock()
+
+
+def _build_client() -> "storage.Client":
+    """Build a storage client whose requests session keeps a larger connection pool."""
+    # Imported here so the SDK is only loaded when first needed
+    import google.auth
+    from google.cloud import storage
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=GCS_POOL_SIZE, pool_maxsize=GCS_POOL_SIZE)
+    session.mount("https://", adapter)
+    return storage.Client(project=PROJECT_ID, credentials=credentials, _http=session)
+
+
+def get_storage_client() -> "storage.Client":
+    """Return the shared storage client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def get_bucket(bucket_name: str = BUCKET_NAME) -> "storage.Bucket":
+    """Return a cached bucket handle (no metadata round trip)."""
+    bucket = _buckets.get(bucket_name)
+    if bucket is None:
+        bucket = get_storage_client().bucket(bucket_name)
+        _buckets[bucket_name] = bucket
+    return bucket
+
+
+def public_url(path: str, bucket_name: str = BUCKET_NAME) -> str:
+    """Public URL for an object path."""
+    return f"https://storage.googleapis.com/{bucket_name}/{path}"
+
+
+def _predefined_acl(make_public: bool) -> Optional[str]:
+    if make_public and GCS_PUBLIC_ACCESS == "object":
+        return "publicRead"
+    return None
+
+
+def upload_bytes(
+    path: str,
+    data: bytes,
+    content_type: str,
+    make_public: bool = True,
+    bucket_name: str = BUCKET_NAME,
+    metadata: Optional[dict] = None
+) -> "storage.Blob":
+    """Upload bytes to an object path, publicly readable unless make_public is False."""
+    blob = get_bucket(bucket_name).blob(path)
+    blob.metadata = metadata
+    blob.upload_from_string(data, content_type=content_type, predefined_acl=_predefined_acl(make_public))
+    return blob
+
+
+def upload_file(
+    path: str,
+    filename: str,
+    content_type: str,
+    make_public: bool = True,
+    bucket_name: str = BUCKET_NAME,
+    metadata: Optional[dict] = None
+) -> "storage.Blob":
+    """Upload a local file with a chunked, resumable upload (memory bounded by chunk size)."""
+    blob = get_bucket(bucket_name).blob(path, chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+    blob.metadata = metadata
+    blob.upload_from_filename(filename, content_type=content_type, predefined_acl=_predefined_acl(make_public))
+    return blob
+
+
+async def upload_bytes_async(*args, **kwargs) -> "storage.Blob":
+    """upload_bytes on a worker thread."""
+    return await asyncio.to_thread(upload_bytes, *args, **kwargs)
+
+
+async def upload_file_async(*args, **kwargs) -> "storage.Blob":
+    """upload_file on a worker thread."""
+    return await asyncio.to_thread(upload_file, *args, **kwargs)
+
+
+async def upload_batch(items: List[dict], bucket_name: str = BUCKET_NAME) -> List["storage.Blob"]:
+    """
+    Upload all objects belonging to one item concurrently.
+
+    Each entry has "path", "content_type" and either "data" (bytes) or
+    "filename" (local file), plus optional "make_public" and "metadata". Returns blobs in
+    the same order; the first failure is raised once every upload finished.
+    """
+    semaphore = asyncio.Semaphore(GCS_UPLOAD_CONCURRENCY)
+
+    async def upload(item: dict) -> "storage.Blob":
+        async with semaphore:
+            if "filename" in item:
+                return await upload_file_async(
+                    item["path"], item["filename"], item["content_type"],
+                    make_public=item.get("make_public", True), bucket_name=bucket_name,
+                    metadata=item.get("metadata")
+                )
+            return await upload_bytes_async(
+                item["path"], item["data"], item["content_type"],
+                make_public=item.get("make_public", True), bucket_name=bucket_name,
+                metadata=item.get("metadata")
+            )
+
+    results = await asyncio.gather(*(upload(item) for item in items), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+def make_bucket_public(bucket_name: str = BUCKET_NAME):
+    """One-off setup for GCS_PUBLIC_ACCESS=bucket: grant allUsers read on every object."""
+    bucket = get_bucket(bucket_name)
+    policy = bucket.get_iam_policy(requested_policy_version=3)
+    policy.bindings.append({"role": "roles/storage.objectViewer", "members": {"allUsers"}})
+    bucket.set_iam_policy(policy)
+
+
+def read_json(path: str, bucket_name: str = BUCKET_NAME) -> Optional[dict]:
+    """Read a JSON object, or None if it does not exist."""
+    from google.api_core.exceptions import NotFound
+
+    try:
+        return json.loads(get_bucket(bucket_name).blob(path).download_as_text())
+    except NotFound:
+        return None
+
+
+def write_json(path: str, data: dict, bucket_name: str = BUCKET_NAME):
+    """Write a private JSON object."""
+    upload_bytes(path, json.dumps(data).encode("utf-8"), "application/json",
+                 make_public=False, bucket_name=bucket_name)
+
+
+def get_blob_metadata(path: str, bucket_name: str = BUCKET_NAME) -> Optional[dict]:
+    """Custom metadata of an object ({} if none), or None if it does not exist."""
+    blob = get_bucket(bucket_name).get_blob(path)
+    if blob is None:
+        return None
+    return blob.metadata or {}
+
+
+def list_blobs(prefix: str, bucket_name: str = BUCKET_NAME) -> Iterator["storage.Blob"]:
+    """List objects under a prefix."""
+    return get_bucket(bucket_name).list_blobs(prefix=prefix)
+
+
+async def delete_blob_async(*args, **kwargs) -> bool:
+    """delete_blob on a worker thread."""
+    return await asyncio.to_thread(delete_blob, *args, **kwargs)
+
+
+def delete_blob(path: str, bucket_name: str = BUCKET_NAME) -> bool:
+    """Delete an object if it exists. Returns True if something was deleted."""
+    blob = get_bucket(bucket_name).blob(path)
+    if blob.exists():
+        blob.delete()
+        return True
+    return False
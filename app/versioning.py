@@ -0,0 +1,212 @@
+"""
+Dataset version for conditional GETs.
+Every transaction that writes figures, etymologies, cognates or fun facts
+bumps a single counter row (dataset_versions) as it commits, so all
+instances agree on it; bump() records changes made outside the database.
+Read endpoints derive their ETag and Last-Modified from that counter,
+cached in process for DATASET_VERSION_TTL seconds; a matching
+If-None-Match is answered with 304 without querying the dataset.
+"""
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+from sqlalchemy import event, insert, select, update
+
+from app.database import SessionLocal, get_engine
+
+if TYPE_CHECKING:
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+DATASET_VERSION_TTL = float(os.getenv("DATASET_VERSION_TTL", "5"))  # seconds other instances may lag
+# Changes with every deploy so a new response format never matches old ETags
+ETAG_SALT = os.getenv("K_REVISION", "")
+
+_lock = threading.Lock()
+_cached: Dict = {"value": None, "expires_at": 0.0}
+
+
+def _tracked_models() -> tuple:
+    from app import models
+    return (models.MythologicalFigure, models.Etymology, models.EnglishCognate, models.FunFact)
+
+
+def ensure_version_row():
+    """Create the version row if it is missing (startup; safe to race). Blocking."""
+    from sqlalchemy.exc import IntegrityError
+    from app import models
+
+    try:
+        with get_engine().begin() as connection:
+            exists = connection.execute(
+                select(models.DatasetVersion.id).where(models.DatasetVersion.id == 1)
+            ).first()
+            if exists is None:
+                connection.execute(insert(models.DatasetVersion).values(
+                    id=1, version=0, updated_at=datetime.now(timezone.utc)
+                ))
+    except IntegrityError:
+        pass  # another instance seeded it first
+
+
+def _increment(connection) -> bool:
+    from app import models
+
+    result = connection.execute(
+        update(models.DatasetVersion)
+        .where(models.DatasetVersion.id == 1)
+        .values(version=models.DatasetVersion.version + 1, updated_at=datetime.now(timezone.utc))
+    )
+    return result.rowcount > 0
+
+
+def bump():
+    """
+    Record a dataset change made outside the tracked models (e.g. a stored
+    image file) in its own transaction. Blocking.
+    """
+    with get_engine().begin() as connection:
+        incremented = _increment(connection)
+    if not incremented:
+        ensure_version_row()
+        with get_engine().begin() as connection:
+            _increment(connection)
+    invalidate()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    tracked = _tracked_models()
+    if any(isinstance(obj, tracked) for obj in session.new) or \
+            any(isinstance(obj, tracked) for obj in session.deleted) or \
+            any(isinstance(obj, tracked) and session.is_modified(obj) for obj in session.dirty):
+        session.info["dataset_changed"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _do_orm_execute(orm_execute_state):
+    # Bulk query.update()/delete() bypass the flush
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _tracked_models()):
+        orm_execute_state.session.info["dataset_changed"] = True
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _before_commit(session):
+    # Flush now so writes flushed by commit itself are seen; the version row
+    # is then locked only for the commit, never across the transaction
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    if not session.info.pop("dataset_changed", False):
+        return
+    connection = session.connection()
+    if not _increment(connection):
+        # Row not seeded yet; create it outside this transaction, then count the write
+        ensure_version_row()
+        _increment(connection)
+    session.info["dataset_bumped"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    if session.info.pop("dataset_bumped", False):
+        invalidate()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("dataset_bumped", None)
+    session.info.pop("dataset_changed", None)
+
+
+def invalidate():
+    """Forget the cached version (and dependent status counters) after a local write."""
+    from app import status
+
+    with _lock:
+        _cached["value"] = None
+    status.invalidate()
+
+
+def _read_version() -> Tuple[int, Optional[datetime]]:
+    from app import models
+
+    with get_engine().connect() as connection:
+        row = connection.execute(
+            select(models.DatasetVersion.version, models.DatasetVersion.updated_at)
+            .where(models.DatasetVersion.id == 1)
+        ).first()
+    if row is None:
+        return 0, None
+    updated_at = row.updated_at
+    if updated_at is not None and updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return row.version, updated_at
+
+
+def current_version() -> Optional[Tuple[int, Optional[datetime]]]:
+    """(version, last write time), cached for DATASET_VERSION_TTL seconds; None if unreadable. Blocking."""
+    now = time.monotonic()
+    with _lock:
+        if _cached["value"] is not None and now < _cached["expires_at"]:
+            return _cached["value"]
+    try:
+        value = _read_version()
+    except Exception as e:
+        # Serve uncached rather than fail the read endpoint
+        print(f"Dataset version unavailable: {e}")
+        return None
+    with _lock:
+        _cached["value"] = value
+        _cached["expires_at"] = time.monotonic() + DATASET_VERSION_TTL
+    return value
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def conditional_get(request: "Request", response: "Response") -> Optional["Response"]:
+    """
+    Validators for a read endpoint. Returns a 304 response when the client's
+    copy is current; otherwise sets ETag/Last-Modified on `response` and
+    returns None so the endpoint builds the body. Blocking.
+    """
+    from starlette.responses import Response
+
+    version = current_version()
+    if version is None:
+        return None
+    number, updated_at = version
+    headers = {
+        "ETag": f'W/"{ETAG_SALT}-{number}"' if ETAG_SALT else f'W/"{number}"',
+        "Cache-Control": "no-cache"
+    }
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, headers["ETag"])
+    elif if_modified_since and updated_at is not None:
+        try:
+            not_modified = updated_at.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            not_modified = False
+    else:
+        not_modified = False
+
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,4 +1,11 @@
-"""Generate content for all 56 mythological figures."""
+"""Generate content for all 56 mythological figures.
+
+Usage:
+    python generate_all_content.py            # one figure at a time
+    python generate_all_content.py --batch    # OpenAI Batch API (half price, up to 24h)
+    python generate_all_content.py --batch --backend local   # offline fake batch
+"""
+import argparse
 import requests
 import time
 import json
@@ -54,7 +61,44 @@ def generate_content_for_figure(figure_id):
     
     return results
 
+def run_batch(backend=None, poll_seconds=30):
+    """Submit all missing content as one Batch API job and wait for ingestion."""
+    params = {"backend": backend} if backend else {}
+    response = requests.post(f"{SERVICE_URL}/api/v1/content/generate-all/batch", params=params, timeout=120)
+    if response.status_code != 200:
+        print(f"❌ Batch submission failed: {response.status_code} {response.text}")
+        return
+    submitted = response.json()
+    if submitted.get("job_id") is None:
+        print(f"✅ {submitted['message']}")
+        return
+    print(f"📦 {submitted['message']} (batch {submitted['batch_id']}, job {submitted['job_id']})")
+    
+    while True:
+        status = requests.get(f"{SERVICE_URL}/api/v1/content/batch-status", timeout=30).json()
+        print(f"   {datetime.now().strftime('%H:%M:%S')} {status['status']}: "
+              f"{status.get('succeeded', 0)} ingested, {status.get('failed', 0)} failed, "
+              f"{status.get('pending', 0)} pending")
+        if not status.get("in_progress"):
+            break
+        time.sleep(poll_seconds)
+    
+    for error in status.get("errors", []):
+        print(f"   ❌ {error['item']}: {error['error']}")
+    final_status = check_status()
+    print(f"\n📊 Origin stories: {final_status['with_origin_stories']}/{final_status['total_figures']}, "
+          f"fun facts: {final_status['total_fun_facts']}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Generate content for all figures")
+    parser.add_argument("--batch", action="store_true", help="use the OpenAI Batch API")
+    parser.add_argument("--backend", choices=["openai", "local"], help="batch backend (default: server setting)")
+    parser.add_argument("--poll", type=float, default=30, help="batch status poll interval in seconds")
+    args = parser.parse_args()
+    if args.batch:
+        run_batch(args.backend, args.poll)
+        return
+    
     print("="*70)
     print("🚀 CONTENT GENERATION FOR ALL 56 FIGURES")
     print("="*70)
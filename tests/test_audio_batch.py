@@ -0,0 +1,64 @@
+"""SSML batch synthesis on the fake TTS backend (no Google credentials needed)."""
+import pytest
+
+from app.audio import generator, mp3
+
+
+@pytest.fixture(autouse=True)
+def fake_tts(monkeypatch, tmp_path):
+    monkeypatch.setattr(generator, "TTS_BACKEND", "fake")
+    monkeypatch.setattr(generator, "AUDIO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(generator, "AUDIO_SSML_BATCH_SIZE", 2)
+
+
+def test_build_marked_ssml_marks_and_escapes_each_text():
+    ssml = generator.build_marked_ssml(["Ζεύς", "A & B"])
+    assert ssml.startswith("<speak>") and ssml.endswith("</speak>")
+    assert '<mark name="s0"/>Ζεύς<mark name="e0"/>' in ssml
+    assert '<mark name="s1"/>A &amp; B<mark name="e1"/>' in ssml
+
+
+def test_slice_frames_cuts_on_frame_boundaries():
+    audio = mp3.silent_frames(1.0)
+    frames = mp3.parse_frames(audio)
+    frame_seconds = frames[0].duration
+    clip = mp3.slice_frames(audio, 10 * frame_seconds, 20 * frame_seconds, frames, pad_frames=0)
+    assert len(mp3.parse_frames(clip)) == 10
+    padded = mp3.slice_frames(audio, 10 * frame_seconds, 20 * frame_seconds, frames)
+    assert len(mp3.parse_frames(padded)) == 12
+    assert mp3.slice_frames(audio, 10.0, 11.0, frames) == b""
+
+
+def test_synthesize_batch_clips_each_name_and_caches_by_mode():
+    texts = ["Ζεύς", "Ἀφροδίτη", "Ἑρμῆς"]
+    results = generator.synthesize_batch(texts)
+
+    for text, (clip, cached, key) in zip(texts, results):
+        assert not cached
+        assert key == generator.synthesis_cache_key(text, mode="ssml_batch")
+        assert key != generator.synthesis_cache_key(text)
+        expected = generator._fake_duration(text, generator.TTS_SPEAKING_RATE)
+        # One padding frame on each side, plus rounding to whole frames
+        assert mp3.duration(clip) == pytest.approx(expected, abs=0.12)
+
+    again = generator.synthesize_batch(texts)
+    assert [cached for _, cached, _ in again] == [True, True, True]
+    # A batch clip never stands in for a single-name synthesis
+    _, from_disk = generator.synthesize_speech(texts[0])
+    assert not from_disk
+
+
+def test_synthesize_batch_falls_back_when_marks_are_missing(monkeypatch):
+    synthesize_marked = generator._synthesize_marked_fake
+
+    def drop_second_marks(texts, speaking_rate):
+        audio, timepoints = synthesize_marked(texts, speaking_rate)
+        timepoints.pop("s1", None)
+        return audio, timepoints
+
+    monkeypatch.setattr(generator, "_synthesize_marked_fake", drop_second_marks)
+    results = generator.synthesize_batch(["Ζεύς", "Ἥρα"])
+
+    assert results[0][2] == generator.synthesis_cache_key("Ζεύς", mode="ssml_batch")
+    assert results[1][2] == generator.synthesis_cache_key("Ἥρα")
+    assert mp3.duration(results[1][0]) > 0
@@ -0,0 +1,107 @@
+"""Content Batch API requests, the local fake backend and idempotent ingestion (in-memory SQLite)."""
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import jobs, models
+from app.content import batch
+from app.database import Base
+
+
+def _figure(figure_id, has_origin_story=False):
+    return {
+        "id": figure_id,
+        "english_name": f"Figure {figure_id}",
+        "greek_name": "Ζεύς",
+        "role": "King of the Gods",
+        "domain": "sky",
+        "symbols": "thunderbolt",
+        "figure_type": "Olympian",
+        "has_origin_story": has_origin_story
+    }
+
+
+@pytest.fixture(autouse=True)
+def local_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(batch, "CONTENT_BATCH_BACKEND", "local")
+    monkeypatch.setattr(batch, "CONTENT_BATCH_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def db_session(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(batch, "SessionLocal", session_factory)
+    monkeypatch.setattr(batch, "get_engine", lambda: engine)
+    with session_factory() as db:
+        db.add_all([models.MythologicalFigure(id=1, english_name="Figure 1"),
+                    models.MythologicalFigure(id=2, english_name="Figure 2")])
+        db.commit()
+    return session_factory
+
+
+def _run_local_batch(lines):
+    backend = batch.get_backend()
+
+    async def run():
+        batch_id = await backend.submit(batch.write_batch_file(lines))
+        return await backend.results(await backend.status(batch_id))
+
+    return asyncio.run(run())
+
+
+def test_build_batch_requests_combines_only_figures_missing_both():
+    figures = [_figure(1), _figure(2, has_origin_story=True), _figure(3, has_origin_story=True)]
+    fact_counts = {3: 4}
+
+    combined = batch.build_batch_requests(figures, fact_counts, combined=True)
+    assert [line["custom_id"] for line in combined] == ["content:1", "facts:2"]
+    assert all(line["url"] == batch.BATCH_ENDPOINT for line in combined)
+
+    split = batch.build_batch_requests(figures, fact_counts, combined=False)
+    assert [line["custom_id"] for line in split] == ["story:1", "facts:1", "facts:2"]
+
+
+def test_local_backend_answers_every_request_with_parseable_content():
+    lines = batch.build_batch_requests([_figure(1), _figure(2)], {}, combined=False)
+    results = _run_local_batch(lines)
+
+    assert [r["custom_id"] for r in results] == ["story:1", "facts:1", "story:2", "facts:2"]
+    for result in results:
+        kind, figure_id, parsed = batch._parse_result(result, {}, seed_cache=False)
+        assert figure_id in (1, 2)
+        assert ("origin_story" if kind == "story" else "fun_facts") in parsed
+
+
+def test_local_backend_requires_server_side_setting(monkeypatch):
+    assert batch.get_backend("openai").name == "openai"
+    monkeypatch.setattr(batch, "CONTENT_BATCH_BACKEND", "openai")
+    with pytest.raises(ValueError):
+        batch.get_backend("local")
+    assert batch.get_backend().name == "openai"
+
+
+def test_ingest_replay_skips_existing_content(monkeypatch, db_session):
+    staged = {}
+    monkeypatch.setattr(jobs, "stage_items_succeeded", lambda db, job_id, results: staged.update(results))
+    requests = batch.build_batch_requests([_figure(1), _figure(2)], {}, combined=True)
+    lines = _run_local_batch(requests)
+
+    first = asyncio.run(batch.ingest_results(7, lines, {}, seed_cache=False))
+    assert first["origin_stories_created"] == 2
+    assert first["fun_facts_created"] == 8
+    assert first["failed"] == 0
+    assert set(staged) == {"content:1", "content:2"}
+
+    replay = asyncio.run(batch.ingest_results(7, lines, {}, seed_cache=False))
+    assert replay["origin_stories_created"] == 0
+    assert replay["fun_facts_created"] == 0
+    with db_session() as db:
+        assert db.query(models.FunFact).count() == 8
+        assert db.query(models.MythologicalFigure).filter(
+            models.MythologicalFigure.origin_story.isnot(None)
+        ).count() == 2